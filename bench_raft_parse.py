@@ -0,0 +1,85 @@
+"""
+Microbenchmark of RaftMessage.parse over the messages of a raft state graph.
+
+    python3 bench_raft_parse.py [state.dot] [--repeat N]
+
+Every message of every state is parsed, as the extractor would when diffing
+states. Without a dot file (e.g. one dumped from raft-tla/raft.tla with
+`-dump dot,actionlabels`), a few built-in sample messages are used. The parse
+before message-type dispatch, which tried each pattern in turn through the
+`re` module cache, is timed alongside for comparison.
+"""
+import argparse
+import re
+import time
+
+import raft_path_generator as raft
+import tlagraph as tg
+
+SAMPLE_MESSAGES = [
+    '[mtype|->RV,mterm|->1,mlastLogTerm|->0,mlastLogIndex|->0,msource|->1,mdest|->2]',
+    '[mtype|->RVR,mterm|->1,msource|->2,mdest|->1,mlog|-><<>>,mvoteGranted|->TRUE]',
+    '[mtype|->AE,mterm|->1,msource|->1,mdest|->2,mprevLogIndex|->0,mprevLogTerm|->0,'
+    'mentries|-><<[term|->1,value|->1]>>,mlog|-><<>>,mcommitIndex|->0]',
+    '[mtype|->AER,mterm|->1,msource|->2,mdest|->1,msuccess|->FALSE,mmatchIndex|->0]',
+]
+
+
+def read_messages(dot_path: str) -> list[tuple[str, int]]:
+    messages = []
+    for kind, _, label, _ in tg.read_dot(dot_path):
+        if kind == tg.NODE:
+            messages.extend(raft.get_messages_from_state(label.decode()).items())
+    return messages
+
+
+def sequential_parse(message: str, count: int) -> raft.RaftMessage:
+    res = raft.RaftMessage()
+    res.count = count
+    for mtype, pattern, names in raft._message_formats.values():
+        if (matched := re.match(pattern.pattern, message)) is not None:
+            res.mtype = mtype
+            for name, value in zip(names, matched.groups()):
+                setattr(res, name, raft._field_parsers.get(name, int)(value))
+            return res
+    raise NotImplementedError(f"Parsing for {message=} is not implemented yet.")
+
+
+def timed(parse, messages, repeat: int) -> float:
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for message, count in messages:
+            parse(message, count)
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('path', nargs='?', help='raft state graph dumped by TLC')
+    parser.add_argument('--repeat', type=int, default=None,
+                        help='passes over the messages (default: enough for about a million parses)')
+    args = parser.parse_args()
+    messages = read_messages(args.path) if args.path is not None else [(m, 1) for m in SAMPLE_MESSAGES]
+    if not messages:
+        raise SystemExit("No messages found")
+    repeat = args.repeat or max(1, 1_000_000 // len(messages))
+    distinct = {message for message, _ in messages}
+    print(f"{len(messages)} messages, {len(distinct)} distinct, {repeat} passes")
+
+    for message in distinct:
+        assert sequential_parse(message, 1).to_dict() == raft.RaftMessage.parse(message, 1).to_dict(), message
+
+    num_parses = len(messages) * repeat
+    results = [('sequential patterns', timed(sequential_parse, messages, repeat))]
+    cached = raft._parse_message_fields
+    raft._parse_message_fields = cached.__wrapped__
+    results.append(('dispatch, no cache', timed(raft.RaftMessage.parse, messages, repeat)))
+    raft._parse_message_fields = cached
+    cached.cache_clear()
+    results.append(('dispatch, cache', timed(raft.RaftMessage.parse, messages, repeat)))
+    for name, elapsed in results:
+        print(f"{name:22} {elapsed:8.3f}s {num_parses / elapsed / 1e6:8.2f}M parses/s")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,665 @@
+"""
+Benchmark suite for the path generation pipeline.
+
+    python3 benchmark.py run [--sizes 1000,10000] [--protocols raft,zk] [-o results.json]
+    python3 benchmark.py compare before.json after.json
+    python3 benchmark.py check [--protocols raft,zk]
+
+`run` generates synthetic state graphs of each size, dumped the way TLC
+dumps them (same node, edge and root lines, same label layout and message
+shapes as raft-tla and zk-tla with three servers; the bounds of a model
+grow until it has that many states), and, with `--tla-jar`,
+also dumps the bundled specs with TLC. Every case runs in a fresh process
+and times each stage on its own, together with the peak RSS of that
+process:
+
+    parse       dot file -> in-memory graph
+    dfs         step-limited DFS, counting the paths it would write
+    extract     extractor over the distinct edges of those paths
+    serialize   JSON encoding of the diffs and writing .node/.edge/.message
+
+Paths are not kept between stages: each one walks them again, less the
+time `dfs` measured for the walk. Results are JSON, so runs on two
+commits can be put side by side with `compare`.
+
+`check` runs regression checks of the on-disk formats on small synthetic
+graphs (see `CHECKS`) and exits non-zero if any fails.
+"""
+import argparse
+import contextlib
+import hashlib
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from collections import deque
+
+STAGES = ('parse', 'dfs', 'extract', 'serialize')
+RESULTS_VERSION = 1
+
+
+def _fingerprint(label: str) -> int:
+    return int.from_bytes(hashlib.blake2b(label.encode(), digest_size=8).digest(), 'little', signed=True)
+
+
+def _escape(label: str) -> str:
+    return label.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _bag_add(bag: tuple, item: str) -> tuple:
+    counts = dict(bag)
+    counts[item] = counts.get(item, 0) + 1
+    return tuple(sorted(counts.items()))
+
+
+def _bag_remove(bag: tuple, item: str) -> tuple:
+    counts = dict(bag)
+    counts[item] -= 1
+    if counts[item] == 0:
+        del counts[item]
+    return tuple(sorted(counts.items()))
+
+
+class SyntheticRaft:
+    """
+    Raft-like states: a message bag, per-server logs and responded client
+    requests, and a term. `bound` scales the largest bag, log and term.
+    """
+
+    def __init__(self, servers: int = 3, bound: int = 1):
+        self.servers = servers
+        self.bound = bound
+        self.init = ((), ((),) * servers, (frozenset(),) * servers, 0)
+
+    def label(self, state) -> str:
+        messages, log, responded, term = state
+        if messages:
+            messages = '(' + ' @@\n  '.join(f'{message} :> {count}' for message, count in messages) + ')'
+        else:
+            messages = '<< >>'
+        log = '<<' + ', '.join('<<' + ', '.join(f'[term |-> 1, value |-> {value}]' for value in entries) + '>>'
+                               for entries in log) + '>>'
+        responded = '<<' + ', '.join('{' + ', '.join(map(str, sorted(ids))) + '}' for ids in responded) + '>>'
+        terms = ', '.join([str(term)] * self.servers)
+        return (f'/\\ messages = {messages}\n/\\ log = {log}\n'
+                f'/\\ responsedClientRequests = {responded}\n/\\ currentTerm = <<{terms}>>')
+
+    def next(self, state):
+        messages, log, responded, term = state
+        successors = []
+        if len(messages) < self.bound + 1:
+            for i in range(1, self.servers + 1):
+                for j in range(1, self.servers + 1):
+                    if i != j and term < self.bound + 1:
+                        message = (f'[mtype |-> RV, mterm |-> {term + 1}, mlastLogTerm |-> 0, '
+                                   f'mlastLogIndex |-> {len(log[i - 1])}, msource |-> {i}, mdest |-> {j}]')
+                        successors.append(('RequestVote', (_bag_add(messages, message), log, responded, term + 1)))
+            entries = ', '.join(f'[term |-> 1, value |-> {value}]' for value in log[0])
+            for j in range(2, self.servers + 1):
+                message = (f'[mtype |-> AE, mterm |-> {term}, msource |-> 1, mdest |-> {j}, mprevLogIndex |-> 0, '
+                           f'mprevLogTerm |-> 0, mentries |-> <<{entries}>>, mlog |-> <<>>, '
+                           f'mcommitIndex |-> {len(responded[0])}]')
+                successors.append(('AppendEntries', (_bag_add(messages, message), log, responded, term)))
+        for message, _ in messages:
+            source = message.split('msource |-> ')[1].split(',')[0]
+            dest = message.split('mdest |-> ')[1].split(',')[0].rstrip(']')
+            if 'mtype |-> RV,' in message:
+                reply = (f'[mtype |-> RVR, mterm |-> {term}, msource |-> {dest}, mdest |-> {source}, '
+                         f'mlog |-> <<>>, mvoteGranted |-> TRUE]')
+                successors.append(('HandleRequestVoteRequest',
+                                   (_bag_add(_bag_remove(messages, message), reply), log, responded, term)))
+            elif 'mtype |-> AE,' in message:
+                reply = (f'[mtype |-> AER, mterm |-> {term}, msource |-> {dest}, mdest |-> {source}, '
+                         f'msuccess |-> FALSE, mmatchIndex |-> 0]')
+                successors.append(('HandleAppendEntriesRequest',
+                                   (_bag_add(_bag_remove(messages, message), reply), log, responded, term)))
+            else:
+                successors.append(('HandleResponse', (_bag_remove(messages, message), log, responded, term)))
+        if len(log[0]) < self.bound + 1:
+            successors.append(('ClientRequest', (messages, (log[0] + (len(log[0]) + 1,),) + log[1:], responded, term)))
+        if len(responded[0]) < len(log[0]):
+            successors.append(('AdvanceCommitIndex',
+                               (messages, log, (responded[0] | {len(responded[0]) + 1},) + responded[1:], term)))
+        return successors
+
+
+class SyntheticZooKeeper:
+    """
+    ZooKeeper-like states: FIFO channels between every pair of servers,
+    histories and commit indices. `bound` scales the number of messages in
+    flight and the length of the leader's history.
+    """
+
+    def __init__(self, servers: int = 3, bound: int = 1):
+        self.servers = servers
+        self.bound = bound
+        self.init = (((),) * servers,) * servers, ((),) * servers, (0,) * servers
+
+    def label(self, state) -> str:
+        channels, history, committed = state
+        messages = '<<' + ', '.join('<<' + ', '.join('<<' + ', '.join(f'[{message}]' for message in channel) + '>>'
+                                                     for channel in row) + '>>' for row in channels) + '>>'
+        history = '<<' + ', '.join('<<' + ', '.join(f'[zxid |-> <<1, {k + 1}>>, value |-> {value}, ackSid |-> {{1}}, '
+                                                    f'epoch |-> 1]' for k, value in enumerate(proposals)) + '>>'
+                                   for proposals in history) + '>>'
+        committed = '<<' + ', '.join(f'[zxid |-> <<0, 0>>, index |-> {index}]' for index in committed) + '>>'
+        states = ', '.join(['LOOKING'] * self.servers)
+        return (f'/\\ msgs = {messages}\n/\\ history = {history}\n/\\ lastCommitted = {committed}\n'
+                f'/\\ state = <<{states}>>')
+
+    def next(self, state):
+        channels, history, committed = state
+        n = self.servers
+        successors = []
+
+        def with_channel(i, j, channel):
+            return tuple(tuple(channel if (a, b) == (i, j) else channels[a][b] for b in range(n)) for a in range(n))
+        if sum(len(channel) for row in channels for channel in row) < self.bound + 2:
+            for j in range(1, n):
+                if not channels[j][0]:
+                    successors.append(('ConnectAndFollowerSendFOLLOWERINFO',
+                                       (with_channel(j, 0, ('mtype |-> FI, mzxid |-> <<0, 0>>',)), history, committed)))
+                proposal = f'mtype |-> PP, mzxid |-> <<1, {len(history[0])}>>, mdata |-> 7'
+                successors.append(('LeaderSyncFollower',
+                                   (with_channel(0, j, channels[0][j] + (proposal,)), history, committed)))
+        for i in range(n):
+            for j in range(n):
+                if channels[i][j]:
+                    successors.append(('FollowerProcess', (with_channel(i, j, channels[i][j][1:]), history, committed)))
+        if len(history[0]) < self.bound + 1:
+            successors.append(('LeaderProcessRequest',
+                               (channels, (history[0] + (len(history[0]) + 10,),) + history[1:], committed)))
+        if committed[0] < len(history[0]):
+            successors.append(('LeaderProcessACK', (channels, history, (committed[0] + 1,) + committed[1:])))
+        return successors
+
+
+SYNTHETIC_MODELS = {'raft': SyntheticRaft, 'zk': SyntheticZooKeeper}
+
+
+def _explore(model, max_states: int) -> tuple[list, list]:
+    """The first `max_states` states of `model` in breadth-first order, and the edges between them."""
+    states = [model.init]
+    seen = {model.init}
+    edges = []
+    for state in states:
+        for action, successor in model.next(state):
+            if successor not in seen:
+                if len(states) >= max_states:
+                    continue
+                seen.add(successor)
+                states.append(successor)
+            edges.append((state, action, successor))
+    return states, edges
+
+
+def write_synthetic_dot(protocol: str, max_states: int, path: str, servers: int = 3) -> int:
+    """
+    Explore a synthetic model breadth-first up to `max_states` states and dump
+    it like `TLC -dump dot,actionlabels`. The bounds of the model are raised
+    until it has that many states. Returns the number of states written.
+    """
+    bound = 1
+    states, edges = _explore(SYNTHETIC_MODELS[protocol](servers, bound), max_states)
+    while len(states) < max_states:
+        bound += 1
+        larger = _explore(SYNTHETIC_MODELS[protocol](servers, bound), max_states)
+        if len(larger[0]) == len(states):
+            break
+        states, edges = larger
+    model = SYNTHETIC_MODELS[protocol](servers, bound)
+    fingerprints = {state: _fingerprint(model.label(state)) for state in states}
+    with open(path, 'w') as dot_file:
+        write = dot_file.write
+        write('strict digraph DiskGraph {\nnodesep=0.35\nsubgraph cluster_graph {\ncolor="white"\n')
+        write(f'{fingerprints[model.init]} [label="{_escape(model.label(model.init))}",style = filled]\n')
+        # Nodes are written before their first in-edge, like TLC does.
+        written = {model.init}
+        for state, action, successor in edges:
+            if successor not in written:
+                written.add(successor)
+                write(f'{fingerprints[successor]} [label="{_escape(model.label(successor))}"];\n')
+            write(f'{fingerprints[state]} -> {fingerprints[successor]} '
+                  f'[label="{action}",color="black",fontcolor="black"];\n')
+        write('}\n')
+        write(f'{{rank = same; {fingerprints[model.init]};}}\n}}\n')
+    return len(states)
+
+
+# Spec directory and file of the bundled models, for dumping with TLC.
+BUNDLED_SPECS = {'raft': ('raft-tla', 'raft'), 'zk': ('zk-tla', 'Zookeeper')}
+
+
+def dump_bundled_spec(protocol: str, tla_jar: str, work_dir: str, timeout: float) -> str:
+    """Dump the state graph of a bundled spec with TLC, returning the dot path, or None if TLC fails."""
+    spec_dir, spec = BUNDLED_SPECS[protocol]
+    spec_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), spec_dir)
+    dump = os.path.join(os.path.abspath(work_dir), f'{protocol}-tla')
+    command = ['java', '-XX:+UseParallelGC', '-cp', tla_jar, 'tlc2.TLC', '-dump', 'dot,actionlabels', dump,
+               '-workers', 'auto', '-metadir', os.path.join(os.path.abspath(work_dir), f'{protocol}-states'),
+               '-config', spec + '.cfg', spec + '.tla']
+    try:
+        subprocess.run(command, cwd=spec_dir, check=True, timeout=timeout,
+                       stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    except (OSError, subprocess.SubprocessError) as e:
+        print(f"Skipping {protocol}-tla, TLC failed: {e}")
+        return None
+    return dump + '.dot'
+
+
+def _peak_rss_kb() -> int:
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports KiB, macOS bytes.
+    return peak // 1024 if sys.platform == 'darwin' else peak
+
+
+def run_case(protocol: str, dot_path: str, step_limit: int, graph_kind: str) -> dict:
+    """Time the stages of one generation run. Meant to run in a fresh process."""
+    import csrgraph
+    import lib
+    import tlagraph as tg
+    from diffcache import DiffCache
+    from extractor import get_extractor
+
+    extractor = get_extractor(protocol)
+    timings = {}
+    out_dir = tempfile.mkdtemp(prefix='tlapp-bench-')
+    try:
+        start = time.perf_counter()
+        if graph_kind == 'csr':
+            graph = csrgraph.CSRGraph.from_file(dot_path)
+        else:
+            graph = tg.TLAGraph.from_file(dot_path)
+        timings['parse'] = time.perf_counter() - start
+
+        path_finder = lib.PathFinder(graph, step_limit, extractor, os.path.join(out_dir, 'paths'))
+        path_finder.quiet = True
+
+        def walk():
+            path_finder.mark_edges_visited()
+            faked_edge = tg.Edge(None, graph.get_node(graph.root_id), None)
+            path_finder.edges_covered = -1
+            return path_finder.iter_paths(faked_edge, [faked_edge], step_limit)
+
+        # Paths are not kept: each stage walks them again, and the time of the
+        # walk measured by `dfs` is taken off the later stages.
+        start = time.perf_counter()
+        num_paths = num_steps = 0
+        for path in walk():
+            num_paths += 1
+            num_steps += len(path) - 1
+        timings['dfs'] = time.perf_counter() - start
+
+        start = time.perf_counter()
+        diffs = {}
+        for path in walk():
+            for edge in path[1:]:
+                key = (edge.src.node_id, edge.dst.node_id, edge.label)
+                if key not in diffs:
+                    diffs[key] = extractor.extract(edge.label, edge.src.label, edge.dst.label)
+        timings['extract'] = max(0.0, time.perf_counter() - start - timings['dfs'])
+
+        start = time.perf_counter()
+        path_finder.diff_cache = DiffCache(len(diffs) + 1)
+        for key, diff in diffs.items():
+            path_finder.diff_cache.put(key, path_finder.serialize(diff))
+        path_finder.write_all_nodes()
+        for path in walk():
+            path_finder.write_one_path(path)
+        path_finder.close()
+        timings['serialize'] = max(0.0, time.perf_counter() - start - timings['dfs'])
+        assert path_finder.diff_cache.misses == 0
+        return {
+            'nodes': graph.number_of_nodes(),
+            'edges': graph.number_of_edges(),
+            'paths': num_paths,
+            'steps': num_steps,
+            'distinct_diffs': len(diffs),
+            'stages': timings,
+            'peak_rss_kb': _peak_rss_kb(),
+        }
+    finally:
+        shutil.rmtree(out_dir, ignore_errors=True)
+
+
+def _git_commit() -> str:
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True, check=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def run(args) -> dict:
+    work_dir = args.work_dir or tempfile.mkdtemp(prefix='tlapp-graphs-')
+    os.makedirs(work_dir, exist_ok=True)
+    cases = []
+    for protocol in args.protocols:
+        for size in args.sizes:
+            dot_path = os.path.join(work_dir, f'{protocol}-{size}.dot')
+            if not os.path.exists(dot_path):
+                print(f"Generating {dot_path}")
+                if write_synthetic_dot(protocol, size, dot_path) < size:
+                    print(f"Warning: the synthetic {protocol} model has fewer than {size} states")
+            cases.append((f'{protocol}-{size}', protocol, dot_path, size))
+        if args.tla_jar is not None:
+            dot_path = dump_bundled_spec(protocol, args.tla_jar, work_dir, args.tlc_timeout)
+            if dot_path is not None:
+                cases.append((f'{protocol}-tla', protocol, dot_path, None))
+
+    results = {
+        'version': RESULTS_VERSION,
+        'commit': _git_commit(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'date': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'step_limit': args.step_limit,
+        'graph': args.graph,
+        'cases': {},
+    }
+    # A fresh process per run keeps the peak RSS and the caches of one case
+    # out of the next.
+    context = multiprocessing.get_context('spawn')
+    for name, protocol, dot_path, size in cases:
+        runs = []
+        for _ in range(args.repeat):
+            with context.Pool(1) as pool:
+                runs.append(pool.apply(run_case, (protocol, dot_path, args.step_limit, args.graph)))
+        case = runs[0]
+        # The fastest of the repeats is the least disturbed by the machine.
+        case['stages'] = {stage: min(run['stages'][stage] for run in runs) for stage in STAGES}
+        case['peak_rss_kb'] = max(run['peak_rss_kb'] for run in runs)
+        case['protocol'] = protocol
+        if size is not None and case['nodes'] != size:
+            # Named by what was measured, so that runs of two sizes never compare the same graph.
+            print(f"Warning: {dot_path} has {case['nodes']} states, not {size}")
+            name = f"{protocol}-{case['nodes']}"
+        results['cases'][name] = case
+        stages = ', '.join(f"{stage} {case['stages'][stage]:.3f}s" for stage in STAGES)
+        print(f"{name}: {case['nodes']} nodes, {case['edges']} edges, {case['paths']} paths; "
+              f"{stages}; peak RSS {case['peak_rss_kb'] / 1024:.1f} MiB")
+    if args.work_dir is None:
+        shutil.rmtree(work_dir, ignore_errors=True)
+    return results
+
+
+def compare(before: dict, after: dict):
+    print(f"before: {before.get('commit')} ({before.get('date')})")
+    print(f"after:  {after.get('commit')} ({after.get('date')})")
+    header = f"{'case':16} {'stage':10} {'before':>10} {'after':>10} {'ratio':>7}"
+    print(header)
+    print('-' * len(header))
+    for name, old in before['cases'].items():
+        new = after['cases'].get(name)
+        if new is None:
+            print(f"{name:16} missing after")
+            continue
+        rows = [(stage, old['stages'][stage], new['stages'][stage], 's') for stage in STAGES]
+        rows.append(('total', sum(old['stages'].values()), sum(new['stages'].values()), 's'))
+        rows.append(('peak RSS', old['peak_rss_kb'] / 1024, new['peak_rss_kb'] / 1024, 'M'))
+        for stage, old_value, new_value, unit in rows:
+            ratio = new_value / old_value if old_value else float('inf')
+            print(f"{name:16} {stage:10} {old_value:9.3f}{unit} {new_value:9.3f}{unit} {ratio:6.2f}x")
+        if (old['paths'], old['steps']) != (new['paths'], new['steps']):
+            print(f"{name:16} paths/steps differ: {old['paths']}/{old['steps']} -> {new['paths']}/{new['steps']}")
+    for name in after['cases'].keys() - before['cases'].keys():
+        print(f"{name:16} missing before")
+
+
+def _generate(protocol: str, dot_path: str, prefix: str, step_limit: int, *options: str) -> int:
+    """Run `lib.generate` as the protocol's generator script would; returns the number of paths."""
+    import lib
+    from extractor import get_extractor
+
+    args = lib.add_arguments(argparse.ArgumentParser()).parse_args(
+        [dot_path, prefix, str(step_limit), '--progress', 'off', *options])
+    return lib.generate(args, get_extractor(protocol))
+
+
+def check_edge_format(protocol: str, dot_path: str, step_limit: int, out_dir: str):
+    """A binary .edge.bin holds the paths of the text .edge line for line, and text paths survive PathWriter."""
+    import pathformat
+
+    text_prefix = os.path.join(out_dir, 'text')
+    binary_prefix = os.path.join(out_dir, 'binary')
+    _generate(protocol, dot_path, text_prefix, step_limit, '--edge-format', 'text')
+    _generate(protocol, dot_path, binary_prefix, step_limit, '--edge-format', 'binary')
+    with open(text_prefix + '.edge') as edge_file:
+        lines = [tuple(line.split()) for line in edge_file]
+    reader = pathformat.PathReader(binary_prefix + '.edge' + pathformat.SUFFIX)
+    try:
+        assert len(reader) == len(lines), f"{len(reader)} binary paths, {len(lines)} text paths"
+        for i, path in enumerate(reader):
+            assert tuple(map(str, path)) == lines[i], f"path {i} differs"
+        assert reader[-1] == reader[len(reader) - 1]
+    finally:
+        reader.close()
+    for suffix in ('.node', '.message'):
+        with open(text_prefix + suffix, 'rb') as text_file, open(binary_prefix + suffix, 'rb') as binary_file:
+            assert text_file.read() == binary_file.read(), f"{suffix} depends on the edge format"
+
+    rewritten = os.path.join(out_dir, 'rewritten.edge' + pathformat.SUFFIX)
+    with pathformat.PathWriter(rewritten) as writer:
+        for line in lines:
+            writer.write_path([step if i % 2 else int(step) for i, step in enumerate(line)])
+    reader = pathformat.PathReader(rewritten)
+    try:
+        assert [tuple(map(str, path)) for path in reader] == lines, "text paths changed through PathWriter"
+    finally:
+        reader.close()
+
+
+def check_path_ranks(protocol: str, dot_path: str, step_limit: int, out_dir: str):
+    """`PathCounter` agrees with a brute-force enumeration of the paths: count, `unrank`, `rank` and sampling."""
+    import csrgraph
+    import pathcount
+
+    graph = csrgraph.CSRGraph.from_file(dot_path)
+    offsets, targets = graph.offsets, graph.targets
+    paths = []
+
+    def enumerate_paths(node, edges):
+        if len(edges) == step_limit or offsets[node] == offsets[node + 1]:
+            paths.append(list(edges))
+            return
+        for i in range(offsets[node], offsets[node + 1]):
+            edges.append(i)
+            enumerate_paths(targets[i], edges)
+            edges.pop()
+
+    enumerate_paths(graph.root, [])
+    counter = pathcount.PathCounter(graph, step_limit)
+    assert counter.num_paths() == len(paths), f"{counter.num_paths()} paths counted, {len(paths)} enumerated"
+    for i, edges in enumerate(paths):
+        assert counter.unrank(i) == edges, f"unrank({i}) is not the {i}-th path"
+        assert counter.rank(edges) == i, f"rank of the {i}-th path is {counter.rank(edges)}"
+    for num_samples in (1, len(paths) // 2, len(paths) + 1):
+        ranks = counter.sample_ranks(num_samples, seed=num_samples)
+        assert ranks == sorted(set(ranks)), "sampled ranks are not distinct and increasing"
+        assert len(ranks) == min(num_samples, len(paths)) and all(0 <= rank < len(paths) for rank in ranks)
+
+
+def _graph_contents(graph) -> tuple:
+    return graph.root_id, [(node_id, graph.get_node(node_id).label,
+                            [(edge.dst.node_id, edge.label) for edge in graph.successor_edges(node_id)])
+                           for node_id in graph.nodes()]
+
+
+def _flip_byte(path: str, position: int):
+    with open(path, 'r+b') as sidecar_file:
+        sidecar_file.seek(position)
+        byte = sidecar_file.read(1)[0]
+        sidecar_file.seek(position)
+        sidecar_file.write(bytes([byte ^ 0xff]))
+
+
+def _sidecar_positions(path: str, magic: bytes, version: int) -> dict:
+    """A byte in the middle of the header and of each non-empty section of a `sidecar` file, by name."""
+    import sidecar
+
+    header = sidecar.read(path, magic, version)[0]
+    data_start = os.path.getsize(path) - header['data_size']
+    positions = {'header': data_start // 2}
+    for name, (offset, length, _, _) in header['sections'].items():
+        if length:
+            positions[name] = data_start + offset + length // 2
+    return positions
+
+
+def _refused(load) -> bool:
+    try:
+        load()
+    except ValueError:
+        return True
+    return False
+
+
+def check_caches(protocol: str, dot_path: str, step_limit: int, out_dir: str):
+    """
+    The graph cache and the diff table are refused once a byte of them is
+    corrupted, they are truncated or their dot file changed, and are then
+    rebuilt to what a fresh parse gives. Labels of the graph cache are only
+    checked as they are read, so the graph is read in full before it counts
+    as accepted.
+    """
+    import csrgraph
+    import difftable
+    from extractor import get_extractor
+
+    extractor = get_extractor(protocol)
+    dot_copy = os.path.join(out_dir, 'graph.dot')
+    shutil.copyfile(dot_path, dot_copy)
+    cache_path = dot_copy + csrgraph.CACHE_SUFFIX
+    table_path = dot_copy + difftable.SUFFIX
+
+    def load_both() -> tuple:
+        graph = csrgraph.load_graph(dot_copy)
+        table = difftable.load_or_build(graph, extractor, table_path, dot_copy)
+        return _graph_contents(graph), [table.get(i) for i in range(len(table))]
+
+    def check_rebuilds():
+        expected_graph = _graph_contents(csrgraph.CSRGraph.from_file(dot_copy))
+        graph, diffs = load_both()
+        assert graph == expected_graph, "graph differs from a fresh parse"
+        key = csrgraph.source_key(dot_copy)
+        sidecars = [
+            (cache_path, csrgraph.CACHE_MAGIC, csrgraph.CACHE_VERSION,
+             lambda: _graph_contents(csrgraph.CSRGraph.load(cache_path, key))),
+            (table_path, difftable.MAGIC, difftable.VERSION, lambda: difftable.DiffTable(table_path, key, extractor)),
+        ]
+        for path, magic, version, load in sidecars:
+            assert not _refused(load), f"{os.path.basename(path)} was refused right after being written"
+            for name, position in _sidecar_positions(path, magic, version).items():
+                _flip_byte(path, position)
+                assert _refused(load), f"{os.path.basename(path)} with a corrupt {name} was accepted"
+                _flip_byte(path, position)
+            # Left truncated, so that loading has to rebuild it.
+            with open(path, 'r+b') as sidecar_file:
+                sidecar_file.truncate(os.path.getsize(path) - 1)
+            assert _refused(load), f"truncated {os.path.basename(path)} was accepted"
+        assert load_both() == (graph, diffs), "rebuilt cache or diff table differs"
+
+    check_rebuilds()
+    # Another dump at the same path, as after re-running TLC with a smaller model.
+    num_nodes = csrgraph.CSRGraph.load(cache_path).number_of_nodes()
+    write_synthetic_dot(protocol, max(1, num_nodes // 2), dot_copy)
+    key = csrgraph.source_key(dot_copy)
+    assert _refused(
+             lambda: _graph_contents(csrgraph.CSRGraph.load(cache_path, key))), "cache of the previous dot file was accepted"
+    assert _refused(lambda: difftable.DiffTable(table_path, key, extractor)), \
+        "diff table of the previous dot file was accepted"
+    check_rebuilds()
+
+
+# Regression checks run by `check`, each given a synthetic graph and its own output directory.
+CHECKS = {
+    'edge-format': check_edge_format,
+    'path-ranks': check_path_ranks,
+    'caches': check_caches,
+}
+
+
+def run_checks(args) -> bool:
+    import progress
+
+    progress.configure('off')
+    work_dir = args.work_dir or tempfile.mkdtemp(prefix='tlapp-check-')
+    os.makedirs(work_dir, exist_ok=True)
+    passed = True
+    try:
+        for protocol in args.protocols:
+            dot_path = os.path.join(work_dir, f'{protocol}-{args.size}.dot')
+            if not os.path.exists(dot_path):
+                write_synthetic_dot(protocol, args.size, dot_path)
+            for name, check in CHECKS.items():
+                out_dir = os.path.join(work_dir, f'{protocol}-{name}')
+                os.makedirs(out_dir, exist_ok=True)
+                try:
+                    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+                        check(protocol, dot_path, args.step_limit, out_dir)
+                except AssertionError as e:
+                    passed = False
+                    print(f"FAIL {protocol} {name}: {e}")
+                else:
+                    print(f"ok   {protocol} {name}")
+    finally:
+        if args.work_dir is None:
+            shutil.rmtree(work_dir, ignore_errors=True)
+    return passed
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the stages of path generation.')
+    commands = parser.add_subparsers(dest='command', required=True)
+    run_parser = commands.add_parser('run', help='run the benchmark suite')
+    run_parser.add_argument('--protocols', type=lambda s: s.split(','), default=['raft', 'zk'],
+                            help='comma-separated synthetic models (default: raft,zk)')
+    run_parser.add_argument('--sizes', type=lambda s: [int(size) for size in s.split(',')], default=[1000, 10000],
+                            help='comma-separated numbers of states of the synthetic graphs (default: 1000,10000)')
+    run_parser.add_argument('--step-limit', type=int, default=8)
+    run_parser.add_argument('--graph', choices=['csr', 'object'], default='csr')
+    run_parser.add_argument('--repeat', type=int, default=1,
+                            help='runs per case, keeping the fastest time of each stage (default: %(default)s)')
+    run_parser.add_argument('--work-dir',
+                            help='keep the generated graphs here and reuse them on later runs (default: a temporary directory)')
+    run_parser.add_argument('--tla-jar', help='tla2tools.jar, to also dump and benchmark the bundled specs')
+    run_parser.add_argument('--tlc-timeout', type=float, default=3600,
+                            help='seconds TLC may take per spec (default: %(default)s)')
+    run_parser.add_argument('-o', '--output', help='write the results as JSON to this file')
+    compare_parser = commands.add_parser('compare', help='compare two results files')
+    compare_parser.add_argument('before')
+    compare_parser.add_argument('after')
+    check_parser = commands.add_parser('check', help='run the regression checks')
+    check_parser.add_argument('--protocols', type=lambda s: s.split(','), default=['raft', 'zk'],
+                              help='comma-separated synthetic models (default: raft,zk)')
+    check_parser.add_argument('--size', type=int, default=300,
+                              help='number of states of the synthetic graphs (default: %(default)s)')
+    check_parser.add_argument('--step-limit', type=int, default=6)
+    check_parser.add_argument('--work-dir', help='keep the graphs and outputs here (default: a temporary directory)')
+    args = parser.parse_args()
+
+    if args.command in ('run', 'check'):
+        unknown = set(args.protocols) - SYNTHETIC_MODELS.keys()
+        if unknown:
+            parser.error(f"unknown protocols {sorted(unknown)}, expected some of {sorted(SYNTHETIC_MODELS)}")
+    if args.command == 'check':
+        sys.exit(0 if run_checks(args) else 1)
+    elif args.command == 'run':
+        results = run(args)
+        if args.output is not None:
+            with open(args.output, 'w') as output_file:
+                json.dump(results, output_file, indent=2)
+                output_file.write('\n')
+    else:
+        with open(args.before) as before_file, open(args.after) as after_file:
+            compare(json.load(before_file), json.load(after_file))
+
+
+if __name__ == '__main__':
+    main()
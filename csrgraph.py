@@ -0,0 +1,324 @@
+import bisect
+import gc
+import hashlib
+import os
+from array import array
+
+import sidecar
+import tlagraph as tg
+
+# Typecodes of the CSR arrays. Node indices are dense and fit in 32 bits,
+# edge and label offsets do not necessarily.
+FINGERPRINT_TYPE = 'q'
+OFFSET_TYPE = 'q'
+INDEX_TYPE = 'i'
+
+# `sidecar` file written next to a dot file by `load_graph`. Bump the version
+# whenever the layout or the meaning of a section changes.
+CACHE_SUFFIX = '.csr'
+CACHE_MAGIC = b'TLAGRAPH'
+CACHE_VERSION = 3
+_cache_sections = ('fingerprints', 'sorted_fingerprints', 'sorted_indices', 'offsets', 'targets',
+                   'actions', 'label_starts', 'label_ends', 'labels')
+
+
+class CSRNode:
+    __slots__ = ('graph', 'index')
+
+    def __init__(self, graph: 'CSRGraph', index: int):
+        self.graph = graph
+        self.index = index
+
+    @property
+    def node_id(self) -> int:
+        return self.graph.fingerprints[self.index]
+
+    @property
+    def label(self) -> str:
+        return self.graph.node_label(self.index)
+
+
+class CSREdge:
+    __slots__ = ('graph', 'index', 'src_index')
+
+    def __init__(self, graph: 'CSRGraph', index: int, src_index: int):
+        self.graph = graph
+        self.index = index
+        self.src_index = src_index
+
+    @property
+    def src(self) -> CSRNode:
+        return CSRNode(self.graph, self.src_index)
+
+    @property
+    def dst(self) -> CSRNode:
+        return CSRNode(self.graph, self.graph.targets[self.index])
+
+    @property
+    def label(self) -> str:
+        return self.graph.action_names[self.graph.actions[self.index]]
+
+    @property
+    def visited(self) -> bool:
+        return bool(self.graph.visited[self.index])
+
+    @visited.setter
+    def visited(self, value: bool):
+        self.graph.visited[self.index] = value
+
+
+class CSRGraph:
+    """
+    Read-only compressed-sparse-row form of a TLC state graph.
+
+    Nodes are renumbered densely in order of first appearance, which is also the
+    order `TLAGraph.nodes()` uses, and each node's out-edges keep file order.
+    Edge `i` of dense node `n` lives at `offsets[n] <= i < offsets[n+1]`, with
+    its target in `targets[i]` and its interned action in `actions[i]`. Labels
+    are byte ranges of `labels`, decoded on access.
+
+    The query methods take and return TLC fingerprints, like `TLAGraph`, so the
+    graph can be handed to `PathFinder` as is.
+    """
+
+    def __init__(self, fingerprints, sorted_fingerprints, sorted_indices, offsets, targets, actions,
+                 action_names: list[str], label_starts, label_ends, labels, root: int):
+        self.fingerprints = fingerprints
+        self.sorted_fingerprints = sorted_fingerprints
+        self.sorted_indices = sorted_indices
+        self.offsets = offsets
+        self.targets = targets
+        self.actions = actions
+        self.action_names = action_names
+        self.label_starts = label_starts
+        self.label_ends = label_ends
+        self.labels = labels
+        self.root = root
+        self.visited = bytearray(len(targets))
+        # The mmap backing the arrays when loaded from a cache file.
+        self.buffer = None
+
+    @staticmethod
+    def from_file(dot_file_path: str) -> 'CSRGraph':
+        gc_was_enabled = gc.isenabled()
+        gc.disable()
+        try:
+            return CSRGraph.from_records(tg.read_dot(dot_file_path))
+        finally:
+            if gc_was_enabled:
+                gc.enable()
+
+    @staticmethod
+    def from_graph(graph: tg.TLAGraph) -> 'CSRGraph':
+        def records():
+            for node_id in graph.nodes():
+                label = graph.get_node(node_id).label
+                yield tg.NODE, node_id, None if label is None else label.encode(), None
+            for node_id in graph.nodes():
+                for edge in graph.successor_edges(node_id):
+                    yield tg.EDGE, node_id, edge.dst.node_id, edge.label
+            if graph.root_id is not None:
+                yield tg.ROOT, graph.root_id, None, None
+        return CSRGraph.from_records(records())
+
+    @staticmethod
+    def from_records(records) -> 'CSRGraph':
+        index: dict[int, int] = {}
+        fingerprints = array(FINGERPRINT_TYPE)
+        label_starts = array(OFFSET_TYPE)
+        label_ends = array(OFFSET_TYPE)
+        labels = bytearray()
+        edge_srcs = array(INDEX_TYPE)
+        edge_dsts = array(INDEX_TYPE)
+        edge_actions = array(INDEX_TYPE)
+        action_ids: dict[str, int] = {}
+        root_id = None
+
+        def intern_node(node_id: int) -> int:
+            n = len(fingerprints)
+            index[node_id] = n
+            fingerprints.append(node_id)
+            label_starts.append(-1)
+            label_ends.append(-1)
+            return n
+
+        for kind, a, b, c in records:
+            if kind == tg.EDGE:
+                src = index[a]
+                dst = index.get(b)
+                if dst is None:
+                    dst = intern_node(b)
+                action = action_ids.get(c)
+                if action is None:
+                    action = action_ids[c] = len(action_ids)
+                edge_srcs.append(src)
+                edge_dsts.append(dst)
+                edge_actions.append(action)
+            elif kind == tg.NODE:
+                n = index.get(a)
+                if n is None:
+                    n = intern_node(a)
+                elif label_starts[n] != -1:
+                    raise RuntimeError(f"Node {a} with non-None label already exists")
+                if b is None:
+                    continue
+                label_starts[n] = len(labels)
+                labels += b
+                label_ends[n] = len(labels)
+            else:
+                root_id = a
+
+        # Stable counting sort of the edges by source.
+        num_nodes = len(fingerprints)
+        num_edges = len(edge_srcs)
+        offsets = array(OFFSET_TYPE, [0]) * (num_nodes + 1)
+        for src in edge_srcs:
+            offsets[src + 1] += 1
+        for n in range(num_nodes):
+            offsets[n + 1] += offsets[n]
+        cursor = array(OFFSET_TYPE, offsets[:-1])
+        targets = array(INDEX_TYPE, [0]) * num_edges
+        actions = array('H' if len(action_ids) <= 1 << 16 else INDEX_TYPE, [0]) * num_edges
+        for src, dst, action in zip(edge_srcs, edge_dsts, edge_actions):
+            i = cursor[src]
+            cursor[src] = i + 1
+            targets[i] = dst
+            actions[i] = action
+        del edge_srcs, edge_dsts, edge_actions, cursor
+
+        order = sorted(range(num_nodes), key=fingerprints.__getitem__)
+        sorted_fingerprints = array(FINGERPRINT_TYPE, (fingerprints[n] for n in order))
+        sorted_indices = array(INDEX_TYPE, order)
+        del order, index
+
+        graph = CSRGraph(fingerprints, sorted_fingerprints, sorted_indices, offsets, targets, actions,
+                         list(action_ids), label_starts, label_ends, labels, -1)
+        if root_id is not None:
+            graph.root = graph.index_of(root_id)
+        return graph
+
+    @property
+    def root_id(self):
+        return None if self.root < 0 else self.fingerprints[self.root]
+
+    def index_of(self, node_id: int) -> int:
+        i = bisect.bisect_left(self.sorted_fingerprints, node_id)
+        if i == len(self.sorted_fingerprints) or self.sorted_fingerprints[i] != node_id:
+            raise KeyError(node_id)
+        return self.sorted_indices[i]
+
+    def node_label(self, index: int) -> str:
+        start = self.label_starts[index]
+        if start < 0:
+            return None
+        return str(self.labels[start:self.label_ends[index]], 'utf-8')
+
+    def number_of_nodes(self) -> int:
+        return len(self.fingerprints)
+
+    def number_of_edges(self) -> int:
+        return len(self.targets)
+
+    def has_node(self, node_id: int) -> bool:
+        i = bisect.bisect_left(self.sorted_fingerprints, node_id)
+        return i < len(self.sorted_fingerprints) and self.sorted_fingerprints[i] == node_id
+
+    def get_node(self, node_id: int) -> CSRNode:
+        return CSRNode(self, self.index_of(node_id))
+
+    def get_edge(self, src_id: int, dst_id: int) -> CSREdge:
+        src = self.index_of(src_id)
+        dst = self.index_of(dst_id)
+        # Like `AdjacencyList.get_edge`, the last of several parallel edges wins.
+        for i in range(self.offsets[src + 1] - 1, self.offsets[src] - 1, -1):
+            if self.targets[i] == dst:
+                return CSREdge(self, i, src)
+        raise KeyError(dst_id)
+
+    def nodes(self):
+        return self.fingerprints
+
+    def successors(self, node_id: int) -> list[int]:
+        src = self.index_of(node_id)
+        fingerprints = self.fingerprints
+        return [fingerprints[dst] for dst in self.targets[self.offsets[src]:self.offsets[src + 1]]]
+
+    def successor_edges(self, node_id: int) -> list[CSREdge]:
+        src = self.index_of(node_id)
+        return [CSREdge(self, i, src) for i in range(self.offsets[src], self.offsets[src + 1])]
+
+    def num_successors(self, node_id: int) -> int:
+        src = self.index_of(node_id)
+        return self.offsets[src + 1] - self.offsets[src]
+
+    def clear_visited(self):
+        self.visited = bytearray(len(self.targets))
+
+    def save(self, cache_path: str, source_key: dict):
+        header = {
+            'source': source_key,
+            'root': self.root,
+            'action_names': self.action_names,
+        }
+        # Labels are paged in as nodes are read, so they are checked the same way.
+        sidecar.write(cache_path, CACHE_MAGIC, CACHE_VERSION, header,
+                      {name: getattr(self, name) for name in _cache_sections}, lazy=('labels',))
+
+    @staticmethod
+    def load(cache_path: str, source_key: dict = None) -> 'CSRGraph':
+        """
+        Memory-map a graph written by `save`. Raises ValueError if the file is
+        not a complete, intact cache of this version, or was built from
+        another source.
+        """
+        header, sections, buffer = sidecar.read(cache_path, CACHE_MAGIC, CACHE_VERSION)
+        try:
+            if source_key is not None and header['source'] != source_key:
+                raise ValueError("cache was built from a different dot file")
+            graph = CSRGraph(action_names=header['action_names'], root=header['root'],
+                             **{name: sections[name] for name in _cache_sections})
+        except (KeyError, TypeError) as e:
+            raise ValueError(f"malformed cache header: {e!r}")
+        graph.buffer = buffer
+        return graph
+
+
+def source_key(dot_file_path: str) -> dict:
+    """
+    Identify a dot file by size, mtime and a digest of sampled blocks. Hashing
+    every byte of a multi-GB dump would cost as much as parsing it.
+    """
+    stat = os.stat(dot_file_path)
+    size = stat.st_size
+    digest = hashlib.blake2b(str(size).encode(), digest_size=16)
+    block = 1 << 16
+    positions = [0, max(size - (1 << 20), 0)] + [size * i // 17 for i in range(1, 17)]
+    with open(dot_file_path, 'rb') as dot_file:
+        for i, position in enumerate(positions):
+            dot_file.seek(position)
+            digest.update(dot_file.read(1 << 20 if i < 2 else block))
+    return {'size': size, 'mtime_ns': stat.st_mtime_ns, 'digest': digest.hexdigest()}
+
+
+def load_graph(dot_file_path: str, cache: bool = True) -> CSRGraph:
+    """
+    Load a dot file through its binary sidecar, parsing and (re)writing the
+    sidecar when it is missing, stale or unreadable.
+    """
+    if not cache:
+        return CSRGraph.from_file(dot_file_path)
+    cache_path = dot_file_path + CACHE_SUFFIX
+    key = source_key(dot_file_path)
+    if os.path.exists(cache_path):
+        try:
+            graph = CSRGraph.load(cache_path, key)
+            print(f'Loaded cached graph {cache_path}')
+            return graph
+        except (OSError, ValueError) as e:
+            print(f'Rebuilding graph cache {cache_path}: {e}')
+    graph = CSRGraph.from_file(dot_file_path)
+    try:
+        graph.save(cache_path, key)
+    except OSError as e:
+        print(f'Could not write graph cache {cache_path}: {e}')
+    return graph
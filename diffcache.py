@@ -0,0 +1,64 @@
+import dbm
+from collections import OrderedDict
+
+DEFAULT_MAX_ENTRIES = 1 << 18
+
+
+class DiffCache:
+    """
+    LRU of serialized extractor output keyed by `(src_id, dst_id, action)`.
+
+    The diff of an edge does not depend on the path it is written for, so
+    `PathFinder.write_one_path` only runs the extractor on a miss. With
+    `spill_path`, entries evicted from memory are moved to a dbm file instead
+    of being dropped, which bounds memory without re-extracting on huge graphs.
+    """
+
+    def __init__(self, max_entries: int = DEFAULT_MAX_ENTRIES, spill_path: str = None):
+        self.max_entries = max_entries
+        self.entries: OrderedDict[tuple, str] = OrderedDict()
+        self.spill_path = spill_path
+        self.spill = dbm.open(spill_path, 'n') if spill_path is not None else None
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _spill_key(key: tuple) -> str:
+        return '%d %d %s' % key
+
+    def get(self, key: tuple) -> str:
+        fragment = self.entries.get(key)
+        if fragment is not None:
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return fragment
+        if self.spill is not None:
+            fragment = self.spill.get(self._spill_key(key))
+            if fragment is not None:
+                self.hits += 1
+                fragment = fragment.decode()
+                self.put(key, fragment)
+                return fragment
+        self.misses += 1
+        return None
+
+    def put(self, key: tuple, fragment: str):
+        if self.max_entries <= 0:
+            return
+        self.entries[key] = fragment
+        if len(self.entries) > self.max_entries:
+            evicted_key, evicted = self.entries.popitem(last=False)
+            if self.spill is not None:
+                self.spill[self._spill_key(evicted_key)] = evicted
+
+    def hit_rate(self) -> float:
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def summary(self) -> str:
+        return f"Diff cache: {self.hits} hits, {self.misses} misses ({100 * self.hit_rate():.1f}% hit rate)"
+
+    def close(self):
+        if self.spill is not None:
+            self.spill.close()
+            self.spill = None
@@ -0,0 +1,204 @@
+"""
+Extractor output for every edge of a graph, computed once and kept on disk.
+
+The diff of an edge depends only on its two states and its action, so
+`build` runs the extractor over all edges up front, optionally on forked
+workers, and `PathFinder` then only looks diffs up. A table is tied to the
+dot file and the protocol of the extractor it was built with, and is
+reused by runs with any step limit or strategy.
+
+Edges are numbered in CSR order: the successor edges of `graph.nodes()`, in
+order, which is the same for `TLAGraph` and `CSRGraph`. Identical diffs are
+stored once. The table is a `sidecar` file with magic b'TLADIFFS'; its
+header holds the source key, the extractor and the ids of failed diffs, and
+its sections are:
+
+    edge_diffs    num_edges x u32, the diff id of each edge
+    offsets       (num_diffs + 1) x u64, start of each diff in `data`
+    data          the serialized diffs (UTF-8 JSON, as written to .message)
+
+An edge whose extraction raised gets the error text as its diff, and its id
+is listed in `errors`; looking it up raises, as extracting it would have.
+"""
+import multiprocessing
+import os
+from array import array
+
+import csrgraph
+import progress
+import sidecar
+from extractor import EXTRACTORS, Extractor, encode_json
+
+SUFFIX = '.diffs'
+MAGIC = b'TLADIFFS'
+VERSION = 2
+DIFF_ID_TYPE = 'I'
+OFFSET_TYPE = 'Q'
+
+
+def extractor_key(extractor: Extractor) -> str:
+    """The protocol name `extractor` is registered as, which does not depend on how its module was run."""
+    for name, cls in EXTRACTORS.items():
+        if type(extractor) is cls:
+            return name
+    return f'{type(extractor).__module__}.{type(extractor).__qualname__}'
+
+
+def _extract_edges(graph, extractor: Extractor, node_ids) -> list[tuple[bool, str]]:
+    """`(failed, serialized diff or error)` of the successor edges of `node_ids`, in order."""
+    results = []
+    for node_id in node_ids:
+        edges = graph.successor_edges(node_id)
+        if not edges:
+            continue
+        src_label = graph.get_node(node_id).label
+        for edge in edges:
+            try:
+                results.append((False, encode_json(extractor.extract(edge.label, src_label, edge.dst.label))))
+            except Exception as e:
+                results.append((True, f'{type(e).__name__}: {e}'))
+    return results
+
+
+# Set in the parent right before the worker pool forks, like `lib._parallel_job`.
+_build_job = None
+
+def _extract_chunk(bounds: tuple[int, int]) -> list[tuple[bool, str]]:
+    graph, extractor = _build_job
+    start, end = bounds
+    return _extract_edges(graph, extractor, graph.nodes()[start:end])
+
+
+def build(graph, extractor: Extractor, path: str, source_key: dict, workers: int = 1, quiet: bool = False):
+    """Extract every edge of `graph` and write the table to `path`."""
+    global _build_job
+    node_ids = graph.nodes()
+    num_nodes = len(node_ids)
+    diff_ids: dict[str, int] = {}
+    errors = []
+    edge_diffs = array(DIFF_ID_TYPE)
+
+    def add(results):
+        for failed, diff in results:
+            diff_id = diff_ids.get(diff)
+            if diff_id is None:
+                diff_id = diff_ids[diff] = len(diff_ids)
+                if failed:
+                    errors.append(diff_id)
+            edge_diffs.append(diff_id)
+
+    chunk_size = max(1, min(4096, num_nodes // (8 * max(workers, 1)) or 1))
+    chunks = [(start, min(start + chunk_size, num_nodes)) for start in range(0, num_nodes, chunk_size)]
+    with progress.Progress("Building diff table", total=graph.number_of_edges(),
+                           completed=lambda: len(edge_diffs), disable=quiet):
+        if workers > 1:
+            _build_job = (graph, extractor)
+            try:
+                with multiprocessing.get_context('fork').Pool(workers) as pool:
+                    for results in pool.imap(_extract_chunk, chunks):
+                        add(results)
+            finally:
+                _build_job = None
+        else:
+            for start, end in chunks:
+                add(_extract_edges(graph, extractor, node_ids[start:end]))
+    if len(edge_diffs) != graph.number_of_edges():
+        raise RuntimeError(f"Extracted {len(edge_diffs)} of {graph.number_of_edges()} edges")
+
+    data = bytearray()
+    offsets = array(OFFSET_TYPE, [0])
+    for diff in diff_ids:
+        data += diff.encode()
+        offsets.append(len(data))
+    header = {'source': source_key, 'extractor': extractor_key(extractor), 'errors': errors}
+    sidecar.write(path, MAGIC, VERSION, header, {'edge_diffs': edge_diffs, 'offsets': offsets, 'data': data})
+    if not quiet:
+        print(f"Wrote diff table {path}: {len(edge_diffs)} edges, {len(diff_ids)} distinct diffs, "
+              f"{len(errors)} failed, {os.path.getsize(path)} bytes")
+
+
+class DiffTable:
+    """
+    A table written by `build`, memory-mapped. Raises ValueError if it is
+    not a complete table of this version for `source_key` and `extractor`.
+    """
+
+    def __init__(self, path: str, source_key: dict = None, extractor: Extractor = None):
+        self.path = path
+        header, sections, self.buffer = sidecar.read(path, MAGIC, VERSION)
+        try:
+            if source_key is not None and header['source'] != source_key:
+                raise ValueError("diff table was built from a different dot file")
+            if extractor is not None and header['extractor'] != extractor_key(extractor):
+                raise ValueError(f"diff table was built with {header['extractor']}")
+            self.errors = frozenset(header['errors'])
+            self.edge_diffs = sections['edge_diffs']
+            self.offsets = sections['offsets']
+            self.data = sections['data']
+        except (KeyError, TypeError) as e:
+            raise ValueError(f"malformed diff table header: {e!r}")
+        if len(self.offsets) == 0 or self.offsets[-1] != len(self.data):
+            raise ValueError("inconsistent diff table offsets")
+        self.num_diffs = len(self.offsets) - 1
+
+    def __len__(self) -> int:
+        return len(self.edge_diffs)
+
+    def diff_id(self, edge_index: int) -> int:
+        """Id of the diff of edge `edge_index`, shared by all edges with an equal diff."""
+        diff_id = self.edge_diffs[edge_index]
+        if diff_id in self.errors:
+            raise RuntimeError(f"Extraction of edge {edge_index} failed when building {self.path}: "
+                               f"{self.diff(diff_id)}")
+        return diff_id
+
+    def diff(self, diff_id: int) -> str:
+        """The serialized diff of id `diff_id`."""
+        return str(self.data[self.offsets[diff_id]:self.offsets[diff_id + 1]], 'utf-8')
+
+    def get(self, edge_index: int) -> str:
+        """The serialized diff of edge `edge_index`."""
+        return self.diff(self.diff_id(edge_index))
+
+    def summary(self) -> str:
+        return f"Diff table {self.path}: {len(self)} edges, {self.num_diffs} distinct diffs"
+
+
+class EdgeIndexer:
+    """Maps the edges of `graph` to their index in a `DiffTable`."""
+
+    def __init__(self, graph):
+        self.graph = graph
+        self.first_edge = None
+        if not isinstance(graph, csrgraph.CSRGraph):
+            self.first_edge = {}
+            index = 0
+            for node_id in graph.nodes():
+                self.first_edge[node_id] = index
+                index += graph.num_successors(node_id)
+
+    def __call__(self, edge) -> int:
+        if self.first_edge is None:
+            return edge.index
+        src_id = edge.src.node_id
+        for i, successor in enumerate(self.graph.successor_edges(src_id)):
+            if successor is edge:
+                return self.first_edge[src_id] + i
+        raise KeyError((src_id, edge.dst.node_id, edge.label))
+
+
+def load_or_build(graph, extractor: Extractor, path: str, dot_file_path: str, workers: int = 1,
+                  rebuild: bool = False) -> DiffTable:
+    """Open the table at `path`, building it first when it is missing, stale or `rebuild` is set."""
+    key = csrgraph.source_key(dot_file_path)
+    if not rebuild and os.path.exists(path):
+        try:
+            table = DiffTable(path, key, extractor)
+            if len(table) == graph.number_of_edges():
+                print(f'Loaded diff table {path}')
+                return table
+            print(f'Rebuilding diff table {path}: it has {len(table)} edges')
+        except (OSError, ValueError) as e:
+            print(f'Rebuilding diff table {path}: {e}')
+    build(graph, extractor, path, key, workers)
+    return DiffTable(path, key, extractor)
@@ -1,10 +1,133 @@
+import importlib
+import json
+from json.encoder import encode_basestring_ascii
+from operator import attrgetter
+
+
 class ProtocolObject:
-    def __init__(self):
-        ...
+    """
+    Base of the objects extractors return. Subclasses list their fields in
+    `__slots__`, in the order they are output; fields left None are not
+    output. `to_dict` and `encode` give the same JSON as the `__dict__`-based
+    objects did, with keys in `__init__` assignment order. Subclasses without
+    `__slots__` still work, from their `__dict__`.
+    """
+    __slots__ = ()
+    # All fields, including those of base classes, and the `"name": ` prefix
+    # each is written with; set for every subclass, fields to None for those
+    # with a `__dict__`.
+    fields: tuple[str, ...] = ()
+    _json_keys: tuple[str, ...] = ()
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        if any('__slots__' not in klass.__dict__ for klass in cls.__mro__[:-1]):
+            cls.fields = None
+            return
+        fields = []
+        for klass in reversed(cls.__mro__):
+            slots = klass.__dict__.get('__slots__', ())
+            fields.extend((slots,) if isinstance(slots, str) else slots)
+        cls.fields = tuple(fields)
+        cls._json_keys = tuple(encode_basestring_ascii(name) + ': ' for name in fields)
+        getter = attrgetter(*fields) if fields else (lambda obj: ())
+        cls._field_values = staticmethod(getter if len(fields) != 1 else lambda obj: (getter(obj),))
+
+    def to_dict(self) -> dict:
+        d = {}
+        items = zip(self.fields, self._field_values(self)) if self.fields is not None else self.__dict__.items()
+        for name, value in items:
+            if value is not None:
+                if isinstance(value, ProtocolObject):
+                    value = value.to_dict()
+                elif isinstance(value, list):
+                    value = [v.to_dict() if isinstance(v, ProtocolObject) else v for v in value]
+                d[name] = value
+        return d
+
+    def encode(self) -> str:
+        """`json.dumps(self.to_dict())`, without building the dict."""
+        if self.fields is None:
+            return _encode_dict(self.to_dict())
+        return '{' + ', '.join([key + _encoders.get(type(value), _encode_other)(value)
+                                for key, value in zip(self._json_keys, self._field_values(self))
+                                if value is not None]) + '}'
+
+
+def _encode_default(o):
+    return None if not isinstance(o, ProtocolObject) else o.to_dict()
+
+
+def _encode_list(values) -> str:
+    return '[' + ', '.join([_encoders.get(type(value), _encode_other)(value) for value in values]) + ']'
+
+
+def _encode_dict(d: dict) -> str:
+    if not all(type(key) is str for key in d):
+        return json.dumps(d, default=_encode_default)
+    return '{' + ', '.join([encode_basestring_ascii(key) + ': ' + _encoders.get(type(value), _encode_other)(value)
+                            for key, value in d.items()]) + '}'
+
+
+def _encode_other(value) -> str:
+    if isinstance(value, ProtocolObject):
+        return value.encode()
+    return json.dumps(value, default=_encode_default)
+
+
+_encoders = {
+    str: encode_basestring_ascii,
+    int: int.__repr__,
+    bool: lambda value: 'true' if value else 'false',
+    type(None): lambda value: 'null',
+    list: _encode_list,
+    tuple: _encode_list,
+    dict: _encode_dict,
+}
+
+
+def encode_json(value) -> str:
+    """
+    `json.dumps(value)` for extractor output: dicts, lists and scalars holding
+    `ProtocolObject`s, which are written field by field from their schema.
+    Anything else is left to `json.dumps`.
+    """
+    return _encoders.get(type(value), _encode_other)(value)
+
 
 class Extractor:
     def __init__(self):
         ...
 
     def extract(self, action, prev_state, cur_state):
-        raise NotImplementedError('extract() is not implemented')
\ No newline at end of file
+        raise NotImplementedError('extract() is not implemented')
+
+
+# Extractor classes by protocol name, filled by `register`.
+EXTRACTORS: dict[str, type[Extractor]] = {}
+# Modules of the extractors that ship with TLAPP, imported on first lookup.
+BUILTIN_EXTRACTORS = {
+    'raft': 'raft_path_generator',
+    'zk': 'zk_path_generator',
+}
+
+
+def register(name: str):
+    """Class decorator making an `Extractor` subclass available as `name`."""
+    def decorator(cls: type[Extractor]) -> type[Extractor]:
+        EXTRACTORS[name] = cls
+        return cls
+    return decorator
+
+
+def protocol_names() -> list[str]:
+    return sorted(set(EXTRACTORS) | set(BUILTIN_EXTRACTORS))
+
+
+def get_extractor(name: str) -> Extractor:
+    """A new extractor registered as `name`, importing its module first if it ships with TLAPP."""
+    if name not in EXTRACTORS and name in BUILTIN_EXTRACTORS:
+        importlib.import_module(BUILTIN_EXTRACTORS[name])
+    if name not in EXTRACTORS:
+        raise KeyError(f"Unknown protocol {name!r}, expected one of {protocol_names()}")
+    return EXTRACTORS[name]()
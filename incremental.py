@@ -0,0 +1,128 @@
+"""
+Reuse the paths of a previous run after a small change to the spec.
+
+States are matched between the old and the new graph by their labels, since
+TLC fingerprints are not stable across spec edits, and edges by the labels of
+both ends and the action. An old path is reused when it still starts at the
+root, fits the step limit and every one of its edges still exists; only the
+edges not covered by reused paths need new paths. The manifest records which
+old paths were kept and which were removed.
+"""
+import json
+import os
+
+import outputs
+import pathformat
+
+
+def find_output(path: str):
+    """The compression an output file was written with, or None if there is none at `path`."""
+    for compression in outputs.COMPRESSIONS:
+        if os.path.exists(outputs.output_path(path, compression)):
+            return compression
+    return None
+
+
+def read_node_labels(node_path: str) -> dict[int, str]:
+    compression = find_output(node_path)
+    if compression is None:
+        raise FileNotFoundError(node_path)
+    labels = {}
+    with outputs.open_text(node_path, compression) as node_file:
+        for line in node_file:
+            split = line.index(' ')
+            labels[int(line[:split])] = line[split + 1:-1]
+    return labels
+
+
+def read_paths(output_prefix: str):
+    """Yield the paths of a previous run as `(node_id, action, node_id, ..., node_id)`."""
+    edge_path = output_prefix + '.edge'
+    compression = find_output(edge_path)
+    if compression is None:
+        if not os.path.exists(edge_path + pathformat.SUFFIX):
+            raise FileNotFoundError(edge_path)
+        reader = pathformat.PathReader(edge_path + pathformat.SUFFIX)
+        yield from reader
+        reader.close()
+        return
+    with outputs.open_text(edge_path, compression) as edge_file:
+        for line in edge_file:
+            elements = line.split()
+            elements[::2] = map(int, elements[::2])
+            yield tuple(elements)
+
+
+class PathMatch:
+    """
+    Old paths of `previous_prefix` checked against `graph`. Path numbers are
+    1-based line numbers of the old `.edge` file, as in print_path.py.
+    """
+
+    def __init__(self, graph, previous_prefix: str, step_limit: int):
+        self.previous_prefix = previous_prefix
+        self.reused: list[int] = []
+        self.removed: list[int] = []
+        # Edges of `graph` on reused paths, to be marked covered.
+        self.edges = []
+
+        new_ids = {}
+        for node_id in graph.nodes():
+            new_ids[graph.get_node(node_id).label] = node_id
+        old_labels = read_node_labels(previous_prefix + '.node')
+        id_map = {}
+        for old_id, label in old_labels.items():
+            new_id = new_ids.get(label)
+            if new_id is not None:
+                id_map[old_id] = new_id
+        del new_ids, old_labels
+        self.num_matched_nodes = len(id_map)
+
+        seen_edges = set()
+        for number, steps in enumerate(read_paths(previous_prefix), 1):
+            edges = self._match(graph, steps, id_map, step_limit)
+            if edges is None:
+                self.removed.append(number)
+                continue
+            self.reused.append(number)
+            for edge in edges:
+                key = (edge.src.node_id, edge.dst.node_id, edge.label)
+                if key not in seen_edges:
+                    seen_edges.add(key)
+                    self.edges.append(edge)
+
+    @staticmethod
+    def _match(graph, steps, id_map: dict, step_limit: int):
+        if len(steps) // 2 > step_limit or id_map.get(steps[0]) != graph.root_id:
+            return None
+        edges = []
+        src = id_map[steps[0]]
+        for i in range(1, len(steps), 2):
+            dst = id_map.get(steps[i + 1])
+            if dst is None:
+                return None
+            for edge in graph.successor_edges(src):
+                if edge.label == steps[i] and edge.dst.node_id == dst:
+                    edges.append(edge)
+                    break
+            else:
+                return None
+            src = dst
+        return edges
+
+    def summary(self) -> str:
+        return (f"Previous run {self.previous_prefix}: {len(self.reused)} paths reused, "
+                f"{len(self.removed)} removed, {self.num_matched_nodes} states matched, "
+                f"{len(self.edges)} edges covered by reused paths")
+
+    def write_manifest(self, path: str, output_prefix: str, num_new_paths: int):
+        manifest = {
+            'previous': self.previous_prefix,
+            'output': output_prefix,
+            'reused': self.reused,
+            'removed': self.removed,
+            'new': num_new_paths,
+        }
+        with open(path, 'w') as manifest_file:
+            json.dump(manifest, manifest_file)
+            manifest_file.write('\n')
@@ -1,67 +1,163 @@
+import argparse
 import codecs
 import copy
 import json
+import math
+import multiprocessing
+import os
 import random
 import re
-import rich
 import sys
 import time
 
-import rich.progress
-from extractor import Extractor, ProtocolObject
-from rich.progress import Progress, BarColumn, TextColumn, TimeRemainingColumn, TimeElapsedColumn, MofNCompleteColumn
+from extractor import Extractor, encode_json
 
+import csrgraph
+import difftable
+import msgtable
+import progress
 import tlagraph as tg
+from diffcache import DiffCache, DEFAULT_MAX_ENTRIES
+import outputs
+import pathformat
+import pathcount
+import pathindex
+from incremental import PathMatch
+from metrics import Metrics, SamplingProfiler
+
+ENGINES = ('iterative', 'recursive')
+STRATEGIES = ('dfs', 'cover', 'sample')
+EDGE_FORMATS = ('text', 'binary')
+
+def write_nodes(graph: tg.TLAGraph, node_file):
+    for node_id in graph.nodes():
+        node = graph.get_node(node_id)
+        node_file.write(str(node_id) + ' ' + node.label + '\n')
+
+def write_node_index(graph: tg.TLAGraph, node_file: outputs.OutputFile):
+    """Index a closed node file written by `write_nodes` with line offsets."""
+    if node_file.line_offsets is not None:
+        pathindex.write_node_index(node_file.path, graph.nodes(), node_file.line_offsets)
 
 class PathFinder:
-    def __init__(self, graph: tg.TLAGraph, step_limit: int, extractor: Extractor, output_prefix: str):
+    def __init__(self, graph: tg.TLAGraph, step_limit: int, extractor: Extractor, output_prefix: str,
+                 engine: str = 'iterative', shard: tuple[int, int] = None, diff_cache: DiffCache = None,
+                 compression: str = 'none', threaded_writer: bool = True, edge_format: str = 'text',
+                 strategy: str = 'dfs', num_samples: int = None, seed: int = None, precovered_edges: list = None,
+                 metrics: Metrics = None, message_table: bool = False, diff_table: difftable.DiffTable = None):
         self.graph: tg.TLAGraph = graph
         self.step_limit = step_limit
         self.extractor = extractor
         self.output_prefix = output_prefix
+        if engine not in ENGINES:
+            raise ValueError(f"Unknown DFS engine {engine!r}, expected one of {ENGINES}")
+        self.engine = engine
+        if strategy not in STRATEGIES:
+            raise ValueError(f"Unknown path strategy {strategy!r}, expected one of {STRATEGIES}")
+        if strategy == 'sample' and num_samples is None:
+            raise ValueError("The sample strategy needs a number of samples")
+        self.strategy = strategy
+        # With the 'sample' strategy, how many paths to draw and the seed to draw them with.
+        self.num_samples = num_samples
+        self.seed = seed
+        # With the 'cover' strategy, edges already on paths reused from a previous run.
+        self.precovered_edges = precovered_edges or []
+        self.metrics = metrics
+        # (rank, number of shards): only every number-of-shards'th path, starting
+        # at rank, is written. Shards never write the node table.
+        self.shard = shard
+        self.diff_cache = diff_cache if diff_cache is not None else DiffCache()
+        # With `diff_table`, diffs are looked up by edge index instead of extracted.
+        self.diff_table = diff_table
+        self.edge_index = difftable.EdgeIndexer(graph) if diff_table is not None else None
+        # With both tables, each distinct diff of `diff_table` encoded against `message_table`, by diff id.
+        self.table_steps: dict[int, str] = {}
 
-        self.node_file = open(output_prefix + '.node', 'w')
-        self.edge_file = open(output_prefix + '.edge', 'w')
-        self.message_file = open(output_prefix + '.message', 'w')
+        def open_output(suffix, line_offsets=False):
+            return outputs.OutputFile(output_prefix + suffix, compression, threaded=threaded_writer,
+                                      line_offsets=line_offsets and compression == 'none')
+        # Uncompressed node and edge files get `pathindex` sidecars for print_path.py.
+        self.node_file = open_output('.node', True) if shard is None else None
+        if edge_format == 'binary':
+            # Random access through the path index needs an uncompressed file.
+            self.edge_file = pathformat.PathWriter(output_prefix + '.edge' + pathformat.SUFFIX)
+        else:
+            self.edge_file = open_output('.edge', shard is None)
+        self.edge_format = edge_format
+        self.message_file = open_output('.message')
+        # With `message_table`, distinct messages go to a table once and steps refer to them by id.
+        self.message_table = msgtable.MessageTable(output_prefix + msgtable.SUFFIX, compression,
+                                                   threaded=threaded_writer) if message_table else None
 
         self.count = 0
-        self.advancer = None
+        self.quiet = False
+        self.num_written = 0
+
+    def close(self):
+        for file in (self.node_file, self.edge_file, self.message_file, self.message_table):
+            if file is not None:
+                file.close()
+        self.diff_cache.close()
+        if self.node_file is not None and len(self.node_file.line_offsets or ()) == self.graph.number_of_nodes():
+            write_node_index(self.graph, self.node_file)
+        if self.edge_format == 'text' and self.edge_file.line_offsets is not None:
+            pathindex.write_line_index(self.edge_file.path, self.edge_file.line_offsets)
+
+    def output_summary(self) -> list[str]:
+        return [file.summary() for file in (self.node_file, self.edge_file, self.message_file, self.message_table)
+                if file is not None]
+
+    def owns_path(self, index: int) -> bool:
+        return self.shard is None or index % self.shard[1] == self.shard[0]
 
 
     def get_node_label(self, node_id):
         return self.graph.get_node(node_id).label
         
     def write_all_nodes(self):
-        for i, node_id in enumerate(self.graph.nodes()):
-            node = self.graph.get_node(node_id)
-            self.node_file.write(str(node_id) + ' ' + node.label + '\n')
+        start_time = time.perf_counter()
+        write_nodes(self.graph, self.node_file)
+        if self.metrics is not None:
+            self.metrics.add_time('write_nodes', time.perf_counter() - start_time)
+
+    def serialize(self, step) -> str:
+        """Serialize the output of the extractor for one step of a path."""
+        if self.message_table is not None:
+            return self.message_table.encode_step(step)
+        return encode_json(step)
+
+    def encode_table_step(self, edge) -> str:
+        """The diff of `edge` from `diff_table`, with its messages replaced by `message_table` ids."""
+        diff_id = self.diff_table.diff_id(self.edge_index(edge))
+        step = self.table_steps.get(diff_id)
+        if step is None:
+            step = self.message_table.encode_step(json.loads(self.diff_table.diff(diff_id)))
+            self.table_steps[diff_id] = step
+        return step
 
     def mark_edges_visited(self):
-        for node_id in self.graph.nodes():
-            for edge in self.graph.successor_edges(node_id):
-                edge.visited = False
+        self.graph.clear_visited()
 
-    def count_path_dfs(self, source: tg.Edge):
+    def count_path_dfs(self, source: tg.Edge, depth: int = 0):
         graph = self.graph
         source.visited = True
-        if graph.num_successors(source.dst.node_id) == 0:
+        self.edges_covered += 1
+        if depth >= self.step_limit or graph.num_successors(source.dst.node_id) == 0:
             self.num_paths += 1
-            if self.advancer is not None:
-                self.advancer()
             return
         for edge in graph.successor_edges(source.dst.node_id):
             if not edge.visited:
-                self.count_path_dfs(edge)
+                self.count_path_dfs(edge, depth + 1)
 
     
     def step_limit_dfs(self, source: tg.Edge, path: list[tuple[int, str]]):
         graph = self.graph
         source.visited = True
+        self.edges_covered += 1
         if len(path)-1 >= self.step_limit or graph.num_successors(source.dst.node_id) == 0:
             self.num_paths += 1
-            if self.advancer is not None:
-                self.advancer()
-            self.write_one_path(path)
+            if self.owns_path(self.num_paths - 1):
+                self.write_one_path(path)
             return
         for edge in graph.successor_edges(source.dst.node_id):
             if not edge.visited:
@@ -69,70 +165,663 @@ class PathFinder:
                 self.step_limit_dfs(edge, path)
                 path.pop()
 
+    def iter_paths(self, source: tg.Edge, path: list[tg.Edge], step_limit=math.inf):
+        """
+        Explicit-stack equivalent of `step_limit_dfs`: yields every path that
+        the recursive version would write, in the same order and with the same
+        edge-visited marking. The yielded list may be reused afterwards.
+        `self.edges_covered` is brought up to date before each yield. On a
+        `TLAGraph` it is only somewhat faster than the recursive version, as
+        both are bound by the per-edge attribute reads; the large gain is on
+        `CSRGraph`, in `_iter_csr_paths`.
+        """
+        if isinstance(self.graph, csrgraph.CSRGraph):
+            yield from self._iter_csr_paths(source, path, step_limit)
+            return
+        adjacency = self.graph.adjacency
+        source.visited = True
+        covered = self.edges_covered + 1
+        edges = adjacency[source.dst.node_id].edges
+        if len(path)-1 >= step_limit or not edges:
+            self.edges_covered = covered
+            yield path
+            return
+        max_length = step_limit + 1
+        # One iterator over out-edges per node on the current path: `top` for
+        # the last one, `stack` for those before it.
+        top = iter(edges)
+        stack = []
+        while True:
+            for edge in top:
+                if not edge.visited:
+                    break
+            else:
+                if not stack:
+                    break
+                top = stack.pop()
+                path.pop()
+                continue
+            edge.visited = True
+            covered += 1
+            path.append(edge)
+            if len(path) >= max_length or not (edges := adjacency[edge.dst.node_id].edges):
+                self.edges_covered = covered
+                yield path
+                path.pop()
+            else:
+                stack.append(top)
+                top = iter(edges)
+        self.edges_covered = covered
+
+    def _iter_csr_paths(self, source: tg.Edge, path: list[tg.Edge], step_limit):
+        # Same traversal as `iter_paths`, but scanning edge indices against the
+        # visited bytearray; edge views are only built for edges that get taken.
+        graph = self.graph
+        offsets, targets, visited = graph.offsets, graph.targets, graph.visited
+        CSREdge = csrgraph.CSREdge
+        source.visited = True
+        covered = self.edges_covered + 1
+        node = graph.index_of(source.dst.node_id)
+        if len(path)-1 >= step_limit or offsets[node+1] == offsets[node]:
+            self.edges_covered = covered
+            yield path
+            return
+        max_length = step_limit + 1
+        nodes = [node]
+        cursors = [offsets[node]]
+        while cursors:
+            i = cursors[-1]
+            src = nodes[-1]
+            end = offsets[src+1]
+            while i < end and visited[i]:
+                i += 1
+            if i == end:
+                cursors.pop()
+                nodes.pop()
+                if cursors:
+                    path.pop()
+                continue
+            cursors[-1] = i + 1
+            visited[i] = 1
+            covered += 1
+            path.append(CSREdge(graph, i, src))
+            dst = targets[i]
+            if len(path) >= max_length or offsets[dst+1] == offsets[dst]:
+                self.edges_covered = covered
+                yield path
+                path.pop()
+            else:
+                nodes.append(dst)
+                cursors.append(offsets[dst])
+        self.edges_covered = covered
+
     def step_limit_dfs_track(self, source: int, num_paths=None, estimate=False) -> int:
+        """
+        Enumerate (and unless `estimate` is set, write) the paths from `source`.
+        Progress is shown against `num_paths` when a previous counting pass
+        provided it, and against the number of edges covered otherwise.
+        """
         if estimate:
-            progress = Progress(TextColumn("Estimating #of Paths"), BarColumn(), 
-                                TextColumn("#of paths: {task.completed}"), 
-                                TimeElapsedColumn())
+            bar = progress.Progress("Counting Paths", completed=lambda: self.num_paths, disable=self.quiet)
+        elif num_paths is not None:
+            bar = progress.Progress("DFS Writing Paths", total=num_paths, completed=lambda: self.num_paths,
+                                    disable=self.quiet)
         else:
-            progress = Progress(TextColumn("DFS Writing Paths"), BarColumn(), 
-                                MofNCompleteColumn(),
-                                TimeElapsedColumn(), TimeRemainingColumn())
-        task_id = progress.add_task("Path Visiting", total=num_paths)
+            bar = progress.Progress("DFS Writing Paths", total=self.graph.number_of_edges(),
+                                    completed=lambda: max(self.edges_covered, 0),
+                                    detail=lambda: f"edges covered, #of paths: {self.num_paths}", disable=self.quiet)
         self.num_paths = 0
-        self.advancer = lambda : progress.advance(task_id)
-        print("Marking edges' visited")
+        # The traversal also counts the faked edge into the source.
+        self.edges_covered = -1
+        if not self.quiet:
+            print("Marking edges' visited")
         self.mark_edges_visited()
         source_node = self.graph.get_node(source)
         faked_edge = tg.Edge(None, source_node, None)
-        with progress:
-            if estimate:
-                self.count_path_dfs(faked_edge)
+        with bar:
+            if self.engine == 'recursive':
+                if estimate:
+                    self.count_path_dfs(faked_edge)
+                else:
+                    self.step_limit_dfs(faked_edge, [faked_edge])
+            elif estimate:
+                for _ in self.iter_paths(faked_edge, [faked_edge], self.step_limit):
+                    self.num_paths += 1
             else:
-                self.step_limit_dfs(faked_edge, [faked_edge])
+                for path in self.iter_paths(faked_edge, [faked_edge], self.step_limit):
+                    self.num_paths += 1
+                    if self.owns_path(self.num_paths - 1):
+                        self.write_one_path(path)
+        if not self.quiet:
+            print(f"Covered {self.edges_covered} of {self.graph.number_of_edges()} edges with {self.num_paths} paths")
+        num_paths = self.num_paths
+        del self.num_paths
+        return num_paths
+
+    def write_paths(self, source: int, num_paths=None) -> int:
+        """Write the paths from `source` with the configured strategy."""
+        metrics = self.metrics
+        if metrics is not None:
+            start_time = time.perf_counter()
+            written = metrics.stage_time('extract', 'serialize', 'write')
+            if metrics.profiler is not None:
+                metrics.profiler.start()
+        try:
+            if self.strategy == 'cover':
+                num_paths = self.path_cover_track(source)
+            elif self.strategy == 'sample':
+                num_paths = self.path_sample_track(source)
+            else:
+                num_paths = self.step_limit_dfs_track(source, num_paths=num_paths)
+        finally:
+            if metrics is not None and metrics.profiler is not None:
+                metrics.profiler.stop()
+        if metrics is not None:
+            written = metrics.stage_time('extract', 'serialize', 'write') - written
+            metrics.add_time('search', time.perf_counter() - start_time - written)
+            metrics.count('paths_written', self.num_written)
+        return num_paths
+
+    def dfs_path_stats(self, source: int) -> tuple[int, int, int]:
+        """
+        Number of paths, total steps and distinct edges on those paths for what
+        `step_limit_dfs_track` would write. Edges the DFS marks visited on its
+        way into an exhausted node end up on no written path, so the last
+        number can be well below the DFS's own edge count.
+        """
+        self.mark_edges_visited()
+        faked_edge = tg.Edge(None, self.graph.get_node(source), None)
+        self.edges_covered = -1
+        num_paths = num_steps = 0
+        on_paths = set()
+        for path in self.iter_paths(faked_edge, [faked_edge], self.step_limit):
+            num_paths += 1
+            num_steps += len(path) - 1
+            on_paths.update((edge.src.node_id, edge.dst.node_id, edge.label) for edge in path[1:])
+        return num_paths, num_steps, len(on_paths)
+
+    def path_cover_track(self, source: int) -> int:
+        """
+        Write a small set of paths from `source`, each at most `step_limit`
+        steps, that together contain every edge whose source is reachable in
+        fewer than `step_limit` steps.
+
+        Edges in `precovered_edges` count as covered from the start.
+
+        Greedy cover: nodes are taken deepest first in BFS order, and while a
+        node has an uncovered out-edge, one path is written through it. The
+        part before the edge is walked backwards from the node, preferring
+        uncovered in-edges whose source is still close enough to the root; the
+        part after it extends along uncovered out-edges (preferring ones whose
+        target has uncovered out-edges of its own); where there are none, it
+        walks the shortest run of covered edges to a node that has one, if
+        that still fits in the step limit. Per-node cursors skip covered
+        out-edges, so the search for the next uncovered edge scans every edge
+        once. A root without out-edges gives the root-only path, as in the DFS.
+        """
+        graph = self.graph
+        step_limit = self.step_limit
+        if not self.quiet:
+            dfs_paths, dfs_steps, dfs_edges = self.dfs_path_stats(source)
+        self.mark_edges_visited()
+        for edge in self.precovered_edges:
+            edge.visited = True
+        faked_edge = tg.Edge(None, graph.get_node(source), None)
+
+        # BFS depth of every node, and the in-edges of each node from nodes
+        # within the step limit.
+        depth = {source: 0}
+        order = [source]
+        out_edges = {}
+        in_edges = {}
+        num_edges = 0
+        for node_id in order:
+            if depth[node_id] >= step_limit:
+                continue
+            edges = out_edges[node_id] = graph.successor_edges(node_id)
+            num_edges += len(edges)
+            for edge in edges:
+                dst = edge.dst.node_id
+                if dst not in depth:
+                    depth[dst] = depth[node_id] + 1
+                    order.append(dst)
+                in_edges.setdefault(dst, []).append(edge)
+        cursors = dict.fromkeys(out_edges, 0)
+
+        def next_uncovered(node_id):
+            edges = out_edges.get(node_id)
+            if edges is None:
+                return None
+            i = cursors[node_id]
+            while i < len(edges) and edges[i].visited:
+                i += 1
+            cursors[node_id] = i
+            return edges[i] if i < len(edges) else None
+
+        def next_extension(node_id):
+            first = next_uncovered(node_id)
+            if first is None:
+                return None
+            edges = out_edges[node_id]
+            for i in range(cursors[node_id], len(edges)):
+                edge = edges[i]
+                if not edge.visited and next_uncovered(edge.dst.node_id) is not None:
+                    return edge
+            return first
+
+        def prefix_edge(node_id, budget):
+            # An in-edge of `node_id` whose source is at most `budget - 1`
+            # steps from the root: the first uncovered one, else the one from
+            # the shallowest source.
+            shallowest = None
+            for edge in in_edges[node_id]:
+                src_depth = depth[edge.src.node_id]
+                if src_depth < budget:
+                    if not edge.visited:
+                        return edge
+                    if shallowest is None or src_depth < depth[shallowest.src.node_id]:
+                        shallowest = edge
+            return shallowest
+
+        def run_to_uncovered(node_id, budget):
+            # The shortest run of out-edges, at most `budget - 1` long, from
+            # `node_id` to a node with an uncovered out-edge, so that the
+            # edge still fits after it; None if there is none.
+            parents = {node_id: None}
+            frontier = [node_id]
+            for _ in range(budget - 1):
+                next_frontier = []
+                for src in frontier:
+                    for edge in out_edges.get(src, ()):
+                        dst = edge.dst.node_id
+                        if dst in parents:
+                            continue
+                        parents[dst] = edge
+                        if next_uncovered(dst) is not None:
+                            run = []
+                            while edge is not None:
+                                run.append(edge)
+                                edge = parents[edge.src.node_id]
+                            run.reverse()
+                            return run
+                        next_frontier.append(dst)
+                frontier = next_frontier
+            return None
+
+        self.num_paths = 0
+        num_steps = 0
+        covered = len(self.precovered_edges)
+        self.edges_covered = covered
+        bar = progress.Progress("Path Cover Writing Paths", total=num_edges, completed=lambda: self.edges_covered,
+                                detail=lambda: f"edges covered, #of paths: {self.num_paths}", disable=self.quiet)
+        with bar:
+            if not out_edges.get(source):
+                # Like the DFS, a root with no step to take is a path of its own.
+                self.num_paths += 1
+                if self.owns_path(0):
+                    self.write_one_path([faked_edge])
+            for node_id in reversed(order):
+                while (edge := next_uncovered(node_id)) is not None:
+                    edge.visited = True
+                    covered += 1
+                    path = [edge]
+                    prefix_node = node_id
+                    while prefix_node != source:
+                        edge = prefix_edge(prefix_node, step_limit - len(path))
+                        if not edge.visited:
+                            edge.visited = True
+                            covered += 1
+                        path.append(edge)
+                        prefix_node = edge.src.node_id
+                    path.append(faked_edge)
+                    path.reverse()
+                    while len(path) <= step_limit:
+                        edge = next_extension(path[-1].dst.node_id)
+                        if edge is None:
+                            # Walk covered edges on to the nearest uncovered one, if it is in reach.
+                            run = None
+                            if covered < num_edges:
+                                run = run_to_uncovered(path[-1].dst.node_id, step_limit + 1 - len(path))
+                            if run is None:
+                                break
+                            path.extend(run)
+                            continue
+                        edge.visited = True
+                        covered += 1
+                        path.append(edge)
+                    self.num_paths += 1
+                    num_steps += len(path) - 1
+                    self.edges_covered = covered
+                    if self.owns_path(self.num_paths - 1):
+                        self.write_one_path(path)
+        self.edges_covered = covered
+        if not self.quiet:
+            print(f"Covered {covered} of {graph.number_of_edges()} edges with {self.num_paths} paths")
+            print(f"Path cover: {self.num_paths} paths, {num_steps} steps; "
+                  f"DFS: {dfs_paths} paths, {dfs_steps} steps, {dfs_edges} distinct edges on its paths")
+        num_paths = self.num_paths
+        del self.num_paths
+        return num_paths
+
+    def path_sample_track(self, source: int) -> int:
+        """
+        Write `num_samples` distinct paths drawn uniformly at random from all
+        paths from `source` that end after `step_limit` steps or at a node
+        without successors, as counted by `pathcount.PathCounter`, or all of
+        them if there are fewer. The same seed draws the same paths, which are
+        written in rank order.
+        """
+        graph = self.graph
+        # Counting works on CSR arrays; an object graph is converted with the
+        # same node and edge order, so edge `i` of node `n` is its `i`-th
+        # successor edge.
+        csr = graph if isinstance(graph, csrgraph.CSRGraph) else csrgraph.CSRGraph.from_graph(graph)
+        counter = pathcount.PathCounter(csr, self.step_limit)
+        start = csr.index_of(source)
+        total = counter.num_paths(start)
+        if not self.quiet:
+            print(f"There are {total} paths of at most {self.step_limit} steps"
+                  f" (about 10^{len(str(total)) - 1})")
+        ranks = counter.sample_ranks(self.num_samples, self.seed, start)
+        source_node = graph.get_node(source)
+        faked_edge = tg.Edge(None, source_node, None)
+        covered = set()
+        self.num_paths = 0
+        with progress.Progress("Writing Sampled Paths", total=len(ranks), completed=lambda: self.num_paths,
+                               disable=self.quiet):
+            for rank in ranks:
+                path = [faked_edge]
+                node = start
+                for i in counter.unrank(rank, start):
+                    covered.add(i)
+                    if csr is graph:
+                        path.append(csrgraph.CSREdge(csr, i, node))
+                    else:
+                        path.append(graph.successor_edges(csr.fingerprints[node])[i - csr.offsets[node]])
+                    node = csr.targets[i]
+                self.num_paths += 1
+                if self.owns_path(self.num_paths - 1):
+                    self.write_one_path(path)
+        self.edges_covered = len(covered)
+        if not self.quiet:
+            print(f"Sampled {self.num_paths} of {total} paths, covering {self.edges_covered} of "
+                  f"{graph.number_of_edges()} edges")
         num_paths = self.num_paths
         del self.num_paths
         return num_paths
 
     def write_one_path(self, path: list[int]):
         graph = self.graph
+        diff_cache = self.diff_cache
+        metrics = self.metrics
+        if metrics is not None:
+            start_time = time.perf_counter()
+            extracted = 0.0
+        self.num_written += 1
         prev_node = None
+        steps = []
+        # Serialized diffs, joined the way json.dumps joins list items.
         diffs = []
         for i, edge in enumerate(path):
             prev_node = edge.src
             node = edge.dst
             action = edge.label
             if i == 0:
-                self.edge_file.write(str(node.node_id) + ' ')
+                steps.append(node.node_id)
             else:
-                self.edge_file.write(action + ' ' + str(node.node_id) + ' ')
+                steps.append(action)
+                steps.append(node.node_id)
                 # write the diff of two nodes to message file
                 assert prev_node is not None
-                diffs.append(self.extractor.extract(action, prev_node.label, node.label))
-        self.edge_file.write('\n')
-        self.message_file.write(json.dumps(diffs, default=lambda o: None if not isinstance(o, ProtocolObject) else o.to_dict()) + '\n')
+                key = (prev_node.node_id, node.node_id, action)
+                diff = diff_cache.get(key)
+                if diff is None:
+                    if self.diff_table is not None and self.message_table is not None:
+                        diff = self.encode_table_step(edge)
+                    elif self.diff_table is not None:
+                        diff = self.diff_table.get(self.edge_index(edge))
+                    elif metrics is None:
+                        diff = self.serialize(self.extractor.extract(action, prev_node.label, node.label))
+                    else:
+                        extract_start = time.perf_counter()
+                        diff = self.extractor.extract(action, prev_node.label, node.label)
+                        serialize_start = time.perf_counter()
+                        diff = self.serialize(diff)
+                        serialize_end = time.perf_counter()
+                        metrics.add_action_time(action, 'extract', serialize_start - extract_start)
+                        metrics.add_action_time(action, 'serialize', serialize_end - serialize_start)
+                        extracted += serialize_end - extract_start
+                    diff_cache.put(key, diff)
+                diffs.append(diff)
+        if self.edge_format == 'binary':
+            self.edge_file.write_path(steps)
+        else:
+            self.edge_file.write(' '.join(map(str, steps)) + ' \n')
+        self.message_file.write('[' + ', '.join(diffs) + ']\n')
+        if metrics is not None:
+            metrics.add_time('write', time.perf_counter() - start_time - extracted)
+            metrics.count('steps', len(steps) // 2)
+
+def shard_prefix(output_prefix: str, rank: int) -> str:
+    return f'{output_prefix}-{rank}'
+
+# Set in the parent right before the worker pool forks, so the graph and the
+# extractor reach the workers without being pickled.
+_parallel_job = None
+
+def _write_shard(rank: int) -> dict:
+    graph, step_limit, extractor, output_prefix, num_shards, diff_cache_size, diff_cache_spill, options = _parallel_job
+    if diff_cache_spill is not None:
+        diff_cache_spill = shard_prefix(diff_cache_spill, rank)
+    if options.get('metrics') is not None:
+        # The parent's metrics were copied by the fork; count this shard's work on its own.
+        profiler = options['metrics'].profiler
+        options = dict(options, metrics=Metrics(
+            SamplingProfiler(profiler.interval) if profiler is not None else None))
+    path_finder = PathFinder(graph, step_limit, extractor, shard_prefix(output_prefix, rank),
+                             shard=(rank, num_shards), diff_cache=DiffCache(diff_cache_size, diff_cache_spill),
+                             **options)
+    path_finder.quiet = True
+    num_paths = path_finder.write_paths(graph.root_id)
+    path_finder.close()
+    return {
+        'num_paths': num_paths,
+        'num_written': path_finder.num_written,
+        'edges_covered': path_finder.edges_covered,
+        'diff_cache_hits': path_finder.diff_cache.hits,
+        'diff_cache_misses': path_finder.diff_cache.misses,
+        'bytes_written': path_finder.edge_file.bytes_written + path_finder.message_file.bytes_written,
+        'bytes_stored': path_finder.edge_file.bytes_stored + path_finder.message_file.bytes_stored,
+        'metrics': count_output_metrics(path_finder).to_dict() if path_finder.metrics is not None else None,
+    }
+
+def parallel_dfs_track(graph, step_limit: int, extractor: Extractor, output_prefix: str, num_workers: int,
+                       diff_cache_size: int = DEFAULT_MAX_ENTRIES, diff_cache_spill: str = None, **options) -> int:
+    """
+    Write the paths of `PathFinder.step_limit_dfs_track` from `num_workers`
+    forked processes. The traversal is deterministic and cheap next to
+    extraction, so every worker repeats it and only extracts and writes the
+    paths whose index is its rank modulo `num_workers`, to
+    `<output_prefix>-<rank>.edge/.message`. Coverage is therefore exactly that
+    of the serial run, and `merge_shards` restores the serial order.
+    `options` are passed on to the workers' `PathFinder`.
+    """
+    global _parallel_job
+    _parallel_job = (graph, step_limit, extractor, output_prefix, num_workers,
+                     diff_cache_size, diff_cache_spill, options)
+    start_time = time.time()
+    results = []
+    try:
+        with multiprocessing.get_context('fork').Pool(num_workers) as pool:
+            with progress.Progress("Writing Path Shards", total=num_workers, completed=lambda: len(results)):
+                for result in pool.imap_unordered(_write_shard, range(num_workers)):
+                    results.append(result)
+    finally:
+        _parallel_job = None
+    elapsed = time.time() - start_time
+    num_paths = results[0]['num_paths']
+    edges_covered = results[0]['edges_covered']
+    assert all(result['num_paths'] == num_paths and result['edges_covered'] == edges_covered for result in results)
+    assert sum(result['num_written'] for result in results) == num_paths
+    print(f"Covered {edges_covered} of {graph.number_of_edges()} edges with {num_paths} paths in {num_workers} shards")
+    # Only used to format the combined hit rate of the workers.
+    diff_cache = DiffCache(0)
+    diff_cache.hits = sum(result['diff_cache_hits'] for result in results)
+    diff_cache.misses = sum(result['diff_cache_misses'] for result in results)
+    print(diff_cache.summary())
+    if options.get('metrics') is not None:
+        for result in results:
+            options['metrics'].merge(result['metrics'])
+    bytes_written = sum(result['bytes_written'] for result in results)
+    bytes_stored = sum(result['bytes_stored'] for result in results)
+    print(f"Shards: {bytes_written} bytes, {bytes_stored} on disk, {bytes_written / elapsed / (1 << 20):.1f} MiB/s")
+    return num_paths
+
+def merge_shards(output_prefix: str, num_shards: int, remove: bool = True, compression: str = 'none',
+                 edge_format: str = 'text', message_table: bool = False):
+    """
+    Interleave the shards written by `parallel_dfs_track` back into
+    `<output_prefix>.edge/.message`, byte-identical to a serial run. With
+    `message_table`, the shards' message tables are merged too and their
+    message ids renumbered.
+    """
+    if edge_format == 'binary':
+        suffix = '.edge' + pathformat.SUFFIX
+        shard_paths = [shard_prefix(output_prefix, rank) + suffix for rank in range(num_shards)]
+        shards = [pathformat.PathReader(shard_path) for shard_path in shard_paths]
+        with pathformat.PathWriter(output_prefix + suffix) as merged:
+            for i in range(sum(len(shard) for shard in shards)):
+                merged.write_path(shards[i % num_shards][i // num_shards])
+        for shard in shards:
+            shard.close()
+        if remove:
+            for shard_path in shard_paths:
+                os.remove(shard_path)
+    for suffix in ('.edge', '.message') if edge_format == 'text' else ('.message',):
+        shard_paths = [shard_prefix(output_prefix, rank) + suffix for rank in range(num_shards)]
+        shards = [outputs.open_text(shard_path, compression) for shard_path in shard_paths]
+        line_offsets = suffix == '.edge' and compression == 'none'
+        tables = merged_table = None
+        if suffix == '.message' and message_table:
+            table_paths = [shard_prefix(output_prefix, rank) + msgtable.SUFFIX for rank in range(num_shards)]
+            tables = [msgtable.read_table(table_path, compression) for table_path in table_paths]
+            merged_table = msgtable.MessageTable(output_prefix + msgtable.SUFFIX, compression)
+        with outputs.OutputFile(output_prefix + suffix, compression, threaded=True,
+                                line_offsets=line_offsets) as merged:
+            # Path i went to shard i % num_shards, so the first shard to run out
+            # marks the end of all of them.
+            while True:
+                for rank, shard in enumerate(shards):
+                    line = shard.readline()
+                    if not line:
+                        break
+                    if tables is not None:
+                        line = merged_table.remap_line(line, tables[rank])
+                    merged.write(line)
+                else:
+                    continue
+                break
+        for shard in shards:
+            shard.close()
+        if merged_table is not None:
+            merged_table.close()
+            if remove:
+                for table_path in table_paths:
+                    os.remove(outputs.output_path(table_path, compression))
+        if line_offsets:
+            pathindex.write_line_index(merged.path, merged.line_offsets)
+        if remove:
+            for shard_path in shard_paths:
+                os.remove(outputs.output_path(shard_path, compression))
 
 """
 Main function
 """
-def main(extractor: Extractor):
-    if (len(sys.argv) > 3):
-        path = sys.argv[1]
-        dir = sys.argv[2]
-        step_limit = int(sys.argv[3])
-    else:
-        print('check your command')
-        sys.exit(1)
-    
-    try:
-        open(path)
-    except IOError as e:
-        sys.stderr.write("ERROR: could not read file" + path + "\n")
-        sys.exit(1)
+def add_arguments(parser: argparse.ArgumentParser) -> argparse.ArgumentParser:
+    """Add the arguments of one generation run, as taken by `generate`."""
+    parser.add_argument('path', help='TLC state graph dumped with `-dump dot,actionlabels`')
+    parser.add_argument('dir', help='output prefix for the .node, .edge and .message files')
+    parser.add_argument('step_limit', type=int)
+    parser.add_argument('--graph', choices=['csr', 'object'], default='csr',
+                        help='in-memory graph representation (default: %(default)s)')
+    parser.add_argument('--lazy-labels', action='store_true',
+                        help='keep node labels in the dot file and read them when needed instead of holding them '
+                             'in memory; implies --graph object')
+    parser.add_argument('--label-cache-size', type=int, default=tg.DEFAULT_LABEL_CACHE_SIZE,
+                        help='number of labels read with --lazy-labels kept decoded (default: %(default)s)')
+    parser.add_argument('--no-cache', action='store_true',
+                        help=f'do not read or write the {csrgraph.CACHE_SUFFIX} graph cache next to the dot file')
+    parser.add_argument('--count-paths', action='store_true',
+                        help='run a counting pass first so that progress is shown against the number of paths')
+    parser.add_argument('--workers', type=int, default=1,
+                        help='number of processes writing path shards <dir>-<rank>.edge/.message (default: %(default)s)')
+    parser.add_argument('--merge', action='store_true',
+                        help='merge the shards written by --workers into <dir>.edge/.message in serial order')
+    parser.add_argument('--diff-cache-size', type=int, default=DEFAULT_MAX_ENTRIES,
+                        help='number of serialized edge diffs kept in memory, 0 to disable (default: %(default)s)')
+    parser.add_argument('--diff-cache-spill', metavar='PATH',
+                        help='move diffs evicted from memory to a dbm file at PATH instead of dropping them')
+    parser.add_argument('--compress', choices=outputs.COMPRESSIONS, default='none',
+                        help='compress the output files (default: %(default)s)')
+    parser.add_argument('--no-writer-thread', action='store_true',
+                        help='write output from the DFS thread instead of a background thread')
+    parser.add_argument('--edge-format', choices=EDGE_FORMATS, default='text',
+                        help='write paths as text <dir>.edge or as the compact binary <dir>.edge.bin described in pathformat.py')
+    parser.add_argument('--engine', choices=ENGINES, default='iterative',
+                        help='DFS implementation used to enumerate paths (default: %(default)s)')
+    parser.add_argument('--diff-table', nargs='?', const='', metavar='PATH',
+                        help=f'extract every edge once into a table at PATH (default: <path>{difftable.SUFFIX}), '
+                             'or reuse it if it was built from the same dot file and extractor, and look diffs up '
+                             'there when writing paths')
+    parser.add_argument('--diff-table-workers', type=int, default=1,
+                        help='number of processes building the diff table (default: %(default)s)')
+    parser.add_argument('--rebuild-diff-table', action='store_true',
+                        help='build the diff table even if a current one exists, e.g. after changing the extractor')
+    parser.add_argument('--message-table', action='store_true',
+                        help=f'write each distinct message once to <dir>{msgtable.SUFFIX} and only message ids and '
+                             'counts to the .message file')
+    parser.add_argument('--strategy', choices=STRATEGIES, default='dfs',
+                        help='write the paths of the step-limited DFS, a greedy set of paths covering '
+                             'the same edges, or paths sampled uniformly (default: %(default)s)')
+    parser.add_argument('--samples', type=int,
+                        help='number of distinct paths drawn by --strategy sample, which requires it; all paths '
+                             'are written if there are fewer')
+    parser.add_argument('--seed', type=int, default=0,
+                        help='random seed of --strategy sample (default: %(default)s)')
+    parser.add_argument('--progress', choices=progress.MODES, default='auto',
+                        help='progress bars (bar), a line every --progress-interval seconds for logs (log), or none '
+                             '(off); auto draws bars when stdout is a terminal (default: %(default)s)')
+    parser.add_argument('--progress-interval', type=float, default=None, metavar='SECONDS',
+                        help='time between progress updates (default: 0.1 for bars, 10 for log lines)')
+    parser.add_argument('--metrics', action='store_true',
+                        help='time each stage and each action and write the totals to <dir>.metrics.json')
+    parser.add_argument('--profile', type=float, nargs='?', const=0.005, metavar='INTERVAL',
+                        help='sample the Python stack every INTERVAL seconds of CPU time while writing paths '
+                             '(default: %(const)s) and add the busiest functions to <dir>.metrics.json; implies --metrics')
+    parser.add_argument('--previous', metavar='PREFIX',
+                        help='reuse the paths of an earlier run with output prefix PREFIX that still exist in this '
+                             'graph, write paths only for the edges they miss (implies --strategy cover) and list '
+                             'reused and removed old paths in <dir>.manifest.json')
+    return parser
+
+def generate(args: argparse.Namespace, extractor: Extractor) -> int:
+    """Write the paths of one run configured by the arguments of `add_arguments`, returning their number."""
+    path = args.path
+    dir = args.dir
+    step_limit = args.step_limit
+    progress.configure(args.progress, args.progress_interval)
+    metrics = None
+    if args.metrics or args.profile is not None:
+        metrics = Metrics(SamplingProfiler(args.profile) if args.profile is not None else None)
 
     start_time = time.time()
-    graph = tg.TLAGraph.from_file(path)
+    if args.graph == 'csr' and not args.lazy_labels:
+        graph = csrgraph.load_graph(path, cache=not args.no_cache)
+    else:
+        graph = tg.TLAGraph.from_file(path, lazy_labels=args.lazy_labels, label_cache_size=args.label_cache_size)
     print(f"Successfully read graph file in {time.time() - start_time}")
+    if metrics is not None:
+        metrics.add_time('load', time.time() - start_time)
 
     n = graph.number_of_nodes()
     e = graph.number_of_edges()
@@ -141,7 +830,97 @@ def main(extractor: Extractor):
     root = graph.root_id
     print("Found the root node:", root)
 
-    path_finder = PathFinder(graph, step_limit, extractor, dir)
+    path_match = None
+    if args.previous is not None:
+        args.strategy = 'cover'
+        start_time = time.time()
+        path_match = PathMatch(graph, args.previous, step_limit)
+        print(path_match.summary())
+        if metrics is not None:
+            metrics.add_time('match', time.time() - start_time)
+
+    diff_table = None
+    if args.diff_table is not None:
+        start_time = time.time()
+        diff_table = difftable.load_or_build(graph, extractor, args.diff_table or path + difftable.SUFFIX, path,
+                                             workers=args.diff_table_workers, rebuild=args.rebuild_diff_table)
+        if metrics is not None:
+            metrics.add_time('diff_table', time.time() - start_time)
+
+    output_options = {'compression': args.compress, 'threaded_writer': not args.no_writer_thread,
+                      'edge_format': args.edge_format, 'strategy': args.strategy,
+                      'num_samples': args.samples, 'seed': args.seed,
+                      'precovered_edges': path_match.edges if path_match is not None else None,
+                      'metrics': metrics, 'message_table': args.message_table, 'diff_table': diff_table}
+    if args.workers > 1:
+        start_time = time.perf_counter()
+        with outputs.OutputFile(dir + '.node', args.compress, line_offsets=args.compress == 'none') as node_file:
+            write_nodes(graph, node_file)
+        write_node_index(graph, node_file)
+        if metrics is not None:
+            metrics.add_time('write_nodes', time.perf_counter() - start_time)
+        num_paths = parallel_dfs_track(graph, step_limit, extractor, dir, args.workers, engine=args.engine,
+                                       diff_cache_size=args.diff_cache_size, diff_cache_spill=args.diff_cache_spill,
+                                       **output_options)
+        if args.merge:
+            merge_shards(dir, args.workers, compression=args.compress, edge_format=args.edge_format,
+                         message_table=args.message_table)
+        if path_match is not None:
+            path_match.write_manifest(dir + '.manifest.json', dir, num_paths)
+        if metrics is not None:
+            write_metrics(metrics, dir, num_paths)
+        return num_paths
+    path_finder = PathFinder(graph, step_limit, extractor, dir, engine=args.engine,
+                             diff_cache=DiffCache(args.diff_cache_size, args.diff_cache_spill), **output_options)
     path_finder.write_all_nodes()
-    num_paths = path_finder.step_limit_dfs_track(root, estimate=True)
-    path_finder.step_limit_dfs_track(root, num_paths=num_paths)
+    num_paths = None
+    if args.count_paths and args.strategy == 'dfs':
+        num_paths = path_finder.step_limit_dfs_track(root, estimate=True)
+    num_paths = path_finder.write_paths(root, num_paths=num_paths)
+    if path_match is not None:
+        path_match.write_manifest(dir + '.manifest.json', dir, num_paths)
+    print(path_finder.diff_cache.summary())
+    if isinstance(graph, tg.TLAGraph) and graph.labels is not None:
+        print(f"Label cache: {graph.labels.hits} hits, {graph.labels.misses} reads from {path}")
+    path_finder.close()
+    for line in path_finder.output_summary():
+        print(line)
+    if metrics is not None:
+        count_output_metrics(path_finder)
+        write_metrics(metrics, dir, num_paths)
+    return num_paths
+
+def count_output_metrics(path_finder: PathFinder) -> Metrics:
+    """Add the diff cache and output counters of a closed `path_finder` to its metrics."""
+    metrics = path_finder.metrics
+    metrics.count('diff_cache_hits', path_finder.diff_cache.hits)
+    metrics.count('diff_cache_misses', path_finder.diff_cache.misses)
+    for file in (path_finder.node_file, path_finder.edge_file, path_finder.message_file):
+        if file is not None:
+            metrics.count('bytes_written', file.bytes_written)
+    return metrics
+
+def write_metrics(metrics: Metrics, output_prefix: str, num_paths: int):
+    metrics.count('paths', num_paths)
+    metrics.write(output_prefix + '.metrics.json')
+    print(metrics.summary())
+
+def check_arguments(args: argparse.Namespace):
+    """Raise ValueError for arguments of `add_arguments` that cannot run together."""
+    if args.strategy == 'sample' and args.samples is None:
+        raise ValueError("--strategy sample requires --samples: graphs it is meant for have too many paths to "
+                         "write them all")
+
+def main(extractor: Extractor):
+    parser = add_arguments(argparse.ArgumentParser())
+    args = parser.parse_args()
+    try:
+        check_arguments(args)
+    except ValueError as e:
+        parser.error(e.args[0])
+    try:
+        open(args.path)
+    except IOError as e:
+        sys.stderr.write("ERROR: could not read file" + args.path + "\n")
+        sys.exit(1)
+    generate(args, extractor)
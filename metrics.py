@@ -0,0 +1,141 @@
+"""
+Cumulative timers and counters for a generation run.
+
+`PathFinder` and `lib.generate` add to a `Metrics` when given one, and the
+summary is written as `<prefix>.metrics.json` at the end of the run. Stages:
+
+    load          reading the dot file or graph cache
+    match         matching the paths of a previous run (--previous)
+    diff_table    loading or building the per-edge diff table (--diff-table)
+    write_nodes   writing the .node file
+    search        finding paths (DFS, cover or sampling), excluding the stages below
+    extract       extractor calls, also broken down by action
+    serialize     encoding the extracted diffs as JSON, also broken down by action
+    write         building and writing .edge/.message lines
+
+Times of parallel runs are summed over the workers.
+"""
+import json
+import signal
+import time
+from collections import Counter, defaultdict
+
+
+class SamplingProfiler:
+    """
+    Statistical profiler: every `interval` seconds of process CPU time,
+    SIGPROF records the Python stack of the main thread. `own` counts the
+    samples in which a function was running, `cumulative` those in which it
+    was anywhere on the stack. Unix only; work done by the writer thread is
+    not seen.
+    """
+
+    def __init__(self, interval: float = 0.005):
+        self.interval = interval
+        self.num_samples = 0
+        self.own = Counter()
+        self.cumulative = Counter()
+        self.previous_handler = None
+
+    def _sample(self, signum, frame):
+        self.num_samples += 1
+        seen = set()
+        first = True
+        while frame is not None:
+            code = frame.f_code
+            key = f'{code.co_filename}:{code.co_firstlineno}({code.co_name})'
+            if first:
+                self.own[key] += 1
+                first = False
+            if key not in seen:
+                seen.add(key)
+                self.cumulative[key] += 1
+            frame = frame.f_back
+
+    def start(self):
+        self.previous_handler = signal.signal(signal.SIGPROF, self._sample)
+        signal.setitimer(signal.ITIMER_PROF, self.interval, self.interval)
+
+    def stop(self):
+        signal.setitimer(signal.ITIMER_PROF, 0)
+        if self.previous_handler is not None:
+            signal.signal(signal.SIGPROF, self.previous_handler)
+            self.previous_handler = None
+
+    def merge(self, profile: dict):
+        self.num_samples += profile['samples']
+        for entry in profile['functions']:
+            self.own[entry['function']] += entry['own']
+            self.cumulative[entry['function']] += entry['cumulative']
+
+    def to_dict(self, limit: int = 50) -> dict:
+        return {
+            'interval': self.interval,
+            'samples': self.num_samples,
+            'functions': [{'function': function, 'own': self.own[function], 'cumulative': samples}
+                          for function, samples in self.cumulative.most_common(limit)],
+        }
+
+
+class Metrics:
+    def __init__(self, profiler: SamplingProfiler = None):
+        self.start_time = time.time()
+        self.stages: dict[str, float] = defaultdict(float)
+        self.counters: dict[str, int] = defaultdict(int)
+        # {action: {stage: [seconds, calls]}}
+        self.actions: dict[str, dict[str, list]] = defaultdict(dict)
+        self.profiler = profiler
+
+    def add_time(self, stage: str, seconds: float):
+        self.stages[stage] += seconds
+
+    def count(self, counter: str, n: int = 1):
+        self.counters[counter] += n
+
+    def add_action_time(self, action: str, stage: str, seconds: float):
+        self.stages[stage] += seconds
+        entry = self.actions[action].get(stage)
+        if entry is None:
+            self.actions[action][stage] = [seconds, 1]
+        else:
+            entry[0] += seconds
+            entry[1] += 1
+
+    def stage_time(self, *stages: str) -> float:
+        return sum(self.stages.get(stage, 0.0) for stage in stages)
+
+    def merge(self, metrics: dict):
+        """Add the `to_dict` of another run, e.g. of a worker."""
+        for stage, seconds in metrics['stages'].items():
+            self.stages[stage] += seconds
+        for counter, n in metrics['counters'].items():
+            self.counters[counter] += n
+        for action, stages in metrics['actions'].items():
+            for stage, entry in stages.items():
+                total = self.actions[action].setdefault(stage, [0.0, 0])
+                total[0] += entry['seconds']
+                total[1] += entry['calls']
+        if self.profiler is not None and 'profile' in metrics:
+            self.profiler.merge(metrics['profile'])
+
+    def to_dict(self) -> dict:
+        result = {
+            'elapsed': time.time() - self.start_time,
+            'stages': dict(self.stages),
+            'counters': dict(self.counters),
+            'actions': {action: {stage: {'seconds': seconds, 'calls': calls}
+                                 for stage, (seconds, calls) in stages.items()}
+                        for action, stages in sorted(self.actions.items())},
+        }
+        if self.profiler is not None:
+            result['profile'] = self.profiler.to_dict()
+        return result
+
+    def summary(self) -> str:
+        stages = ', '.join(f'{stage} {seconds:.2f}s' for stage, seconds in self.stages.items())
+        return f"Stages: {stages}"
+
+    def write(self, path: str):
+        with open(path, 'w') as metrics_file:
+            json.dump(self.to_dict(), metrics_file, indent=2)
+            metrics_file.write('\n')
@@ -0,0 +1,80 @@
+"""
+Deduplicated message output (`--message-table`).
+
+Every distinct message, serialized without its count, is written once to
+`<prefix>.msgtable`, one per line; its id is its 0-based line number. The
+steps in `.message` then hold `[id, count]` pairs instead of the messages:
+
+    {"action": "HandleRequestVoteRequest", "diff": [[3, 1], [0, -1]]}
+
+Ids are given in order of first use, so a merged parallel run numbers them
+exactly like a serial one. `expand_step` turns a step back into the form
+written without the table.
+"""
+import json
+
+import outputs
+from extractor import ProtocolObject, encode_json
+
+SUFFIX = '.msgtable'
+
+
+class MessageTable:
+    def __init__(self, path: str, compression: str = 'none', threaded: bool = False):
+        self.ids: dict[str, int] = {}
+        self.file = outputs.OutputFile(path, compression, threaded=threaded)
+
+    def message_id(self, message: str) -> int:
+        """Id of a message serialized without its count, added to the table if new."""
+        message_id = self.ids.get(message)
+        if message_id is None:
+            message_id = self.ids[message] = len(self.ids)
+            self.file.write(message + '\n')
+        return message_id
+
+    def encode_step(self, step) -> str:
+        """Serialize the output of `Extractor.extract` with the messages of its `diff` replaced by ids."""
+        if not isinstance(step, dict) or not isinstance(step.get('diff'), list):
+            return encode_json(step)
+        diff = []
+        for message in step['diff']:
+            if isinstance(message, ProtocolObject):
+                message = message.to_dict()
+            else:
+                message = dict(message)
+            count = message.pop('count', None)
+            diff.append([self.message_id(encode_json(message)), count])
+        return json.dumps(dict(step, diff=diff))
+
+    def remap_line(self, line: str, table: list[str]) -> str:
+        """Renumber a `.message` line written against another table, e.g. a shard's."""
+        steps = json.loads(line)
+        for step in steps:
+            if isinstance(step, dict) and isinstance(step.get('diff'), list):
+                step['diff'] = [[self.message_id(table[message_id]), count] for message_id, count in step['diff']]
+        return json.dumps(steps) + '\n'
+
+    def close(self):
+        self.file.close()
+
+    def summary(self) -> str:
+        return f"{self.file.summary()}, {len(self.ids)} distinct messages"
+
+
+def read_table(path: str, compression: str = 'none') -> list[str]:
+    """The serialized messages of a table written by `MessageTable`, by id."""
+    with outputs.open_text(path, compression) as table_file:
+        return [line.rstrip('\n') for line in table_file]
+
+
+def expand_step(step: dict, messages: list[dict]) -> dict:
+    """A step of a `.message` line with the full messages, as written without the table."""
+    if not isinstance(step, dict) or not isinstance(step.get('diff'), list):
+        return step
+    diff = []
+    for message_id, count in step['diff']:
+        message = dict(messages[message_id])
+        if count is not None:
+            message['count'] = count
+        diff.append(message)
+    return dict(step, diff=diff)
@@ -0,0 +1,139 @@
+import gzip
+import io
+import queue
+import threading
+import time
+from array import array
+
+COMPRESSIONS = ('none', 'gzip', 'zstd')
+SUFFIXES = {'none': '', 'gzip': '.gz', 'zstd': '.zst'}
+
+# Text is encoded and handed to the file in batches of about this many bytes.
+DEFAULT_BUFFER_SIZE = 1 << 22
+# Batches the writer thread may fall behind by before `write` blocks.
+QUEUE_DEPTH = 8
+
+
+def _zstandard():
+    try:
+        import zstandard
+    except ImportError:
+        raise RuntimeError("zstd output needs the `zstandard` package (pip install zstandard)")
+    return zstandard
+
+
+def output_path(path: str, compression: str = 'none') -> str:
+    return path + SUFFIXES[compression]
+
+
+def open_text(path: str, compression: str = 'none'):
+    """Open a file written by `OutputFile` for reading text."""
+    path = output_path(path, compression)
+    if compression == 'gzip':
+        return gzip.open(path, 'rt')
+    elif compression == 'zstd':
+        return io.TextIOWrapper(_zstandard().ZstdDecompressor().stream_reader(open(path, 'rb')))
+    return open(path)
+
+
+class OutputFile:
+    """
+    Write-only text output with large batches, optional gzip/zstd compression
+    and, with `threaded`, a background thread that encodes-compresses-writes
+    while the caller keeps producing text.
+
+    `path` gets the compression's suffix appended. `bytes_written` counts
+    uncompressed bytes, `bytes_stored` what ended up on disk. With
+    `line_offsets`, each `write` call is taken to be one line and its start
+    offset is recorded in `self.line_offsets` for `pathindex`.
+    """
+
+    def __init__(self, path: str, compression: str = 'none', buffer_size: int = DEFAULT_BUFFER_SIZE,
+                 threaded: bool = False, line_offsets: bool = False):
+        if compression not in COMPRESSIONS:
+            raise ValueError(f"Unknown compression {compression!r}, expected one of {COMPRESSIONS}")
+        if line_offsets and compression != 'none':
+            raise ValueError("Line offsets are only meaningful for uncompressed output")
+        self.path = output_path(path, compression)
+        self.raw = open(self.path, 'wb')
+        if compression == 'gzip':
+            self.stream = gzip.GzipFile(fileobj=self.raw, mode='wb', compresslevel=6)
+        elif compression == 'zstd':
+            self.stream = _zstandard().ZstdCompressor().stream_writer(self.raw, closefd=False)
+        else:
+            self.stream = self.raw
+        self.buffer_size = buffer_size
+        self.parts: list[str] = []
+        self.pending = 0
+        self.bytes_written = 0
+        self.bytes_stored = 0
+        self.start_time = time.time()
+        self.elapsed = None
+        self.error = None
+        self.line_offsets = array('Q') if line_offsets else None
+        self.position = 0
+        self.queue = None
+        if threaded:
+            self.queue = queue.Queue(QUEUE_DEPTH)
+            self.thread = threading.Thread(target=self._drain, name=f'writer {self.path}', daemon=True)
+            self.thread.start()
+
+    def _drain(self):
+        while (data := self.queue.get()) is not None:
+            if self.error is None:
+                try:
+                    self.stream.write(data)
+                except BaseException as e:
+                    self.error = e
+
+    def _check(self):
+        if self.error is not None:
+            raise RuntimeError(f"Writing {self.path} failed") from self.error
+
+    def write(self, text: str):
+        if self.line_offsets is not None:
+            self.line_offsets.append(self.position)
+            self.position += len(text) if text.isascii() else len(text.encode())
+        self.parts.append(text)
+        self.pending += len(text)
+        if self.pending >= self.buffer_size:
+            self.flush()
+
+    def flush(self):
+        if not self.parts:
+            return
+        data = ''.join(self.parts).encode()
+        self.parts = []
+        self.pending = 0
+        self.bytes_written += len(data)
+        if self.queue is not None:
+            self._check()
+            self.queue.put(data)
+        else:
+            self.stream.write(data)
+
+    def close(self):
+        if self.raw.closed:
+            return
+        self.flush()
+        if self.queue is not None:
+            self.queue.put(None)
+            self.thread.join()
+        if self.stream is not self.raw:
+            self.stream.close()
+        self.bytes_stored = self.raw.tell()
+        self.raw.close()
+        self.elapsed = time.time() - self.start_time
+        self._check()
+
+    def summary(self) -> str:
+        elapsed = self.elapsed if self.elapsed is not None else time.time() - self.start_time
+        throughput = self.bytes_written / elapsed / (1 << 20) if elapsed > 0 else 0.0
+        stored = f", {self.bytes_stored} on disk" if self.stream is not self.raw else ""
+        return f"{self.path}: {self.bytes_written} bytes{stored}, {throughput:.1f} MiB/s"
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
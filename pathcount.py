@@ -0,0 +1,114 @@
+"""
+Exact counting, ranking and uniform sampling of bounded-length root paths.
+
+The paths counted are the ones the DFS would end a path at: a path from the
+root ends after `step_limit` steps or at a node without successors. Parallel
+edges with different actions are different paths. Counts are Python ints, so
+they do not overflow however many paths the graph has.
+
+Paths are ranked in lexicographic order of their edge indices, i.e. the order
+an exhaustive DFS without edge marking would visit them in.
+"""
+import random
+import sys
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+import csrgraph
+
+
+class PathCounter:
+    """
+    `counts[d][n]` is the number of paths from dense node `n` with `d` steps
+    left. Layers are computed bottom-up from `d = 0`, each as one
+    gather-and-segment-sum over the CSR arrays when NumPy is available.
+    """
+
+    def __init__(self, graph: csrgraph.CSRGraph, step_limit: int):
+        self.graph = graph
+        self.step_limit = step_limit
+        offsets, targets = graph.offsets, graph.targets
+        num_nodes = graph.number_of_nodes()
+        terminal = [offsets[n] == offsets[n + 1] for n in range(num_nodes)]
+        layer = [1] * num_nodes
+        self.counts = [layer]
+        if numpy is not None and len(targets):
+            np_targets = numpy.asarray(targets)
+            starts = numpy.asarray(offsets)[:-1]
+            inner = numpy.flatnonzero(~numpy.array(terminal, dtype=bool))
+            # reduceat needs every start to index into the gathered array.
+            inner_starts = starts[inner]
+            for _ in range(step_limit):
+                previous = numpy.array(layer, dtype=object)
+                sums = numpy.add.reduceat(previous[np_targets], inner_starts)
+                current = numpy.ones(num_nodes, dtype=object)
+                current[inner] = sums
+                layer = current.tolist()
+                self.counts.append(layer)
+        else:
+            for _ in range(step_limit):
+                previous = layer
+                layer = [1 if terminal[n] else sum(previous[t] for t in targets[offsets[n]:offsets[n + 1]])
+                         for n in range(num_nodes)]
+                self.counts.append(layer)
+
+    def num_paths(self, source: int = None) -> int:
+        source = self.graph.root if source is None else source
+        return self.counts[self.step_limit][source]
+
+    def unrank(self, rank: int, source: int = None) -> list[int]:
+        """The edge indices of the path with the given 0-based rank."""
+        source = self.graph.root if source is None else source
+        if not 0 <= rank < self.num_paths(source):
+            raise IndexError(rank)
+        offsets, targets, counts = self.graph.offsets, self.graph.targets, self.counts
+        edges = []
+        node = source
+        for left in range(self.step_limit, 0, -1):
+            below = counts[left - 1]
+            for i in range(offsets[node], offsets[node + 1]):
+                count = below[targets[i]]
+                if rank < count:
+                    break
+                rank -= count
+            else:
+                # Terminal node: the path ends here.
+                break
+            edges.append(i)
+            node = targets[i]
+        return edges
+
+    def rank(self, edges: list[int], source: int = None) -> int:
+        """Inverse of `unrank`."""
+        source = self.graph.root if source is None else source
+        offsets, targets, counts = self.graph.offsets, self.graph.targets, self.counts
+        rank = 0
+        node = source
+        for left, edge in zip(range(self.step_limit, 0, -1), edges):
+            if not offsets[node] <= edge < offsets[node + 1]:
+                raise ValueError(f"Edge {edge} does not leave node {node}")
+            below = counts[left - 1]
+            rank += sum(below[targets[i]] for i in range(offsets[node], edge))
+            node = targets[edge]
+        return rank
+
+    def sample_ranks(self, num_samples: int, seed=None, source: int = None) -> list[int]:
+        """
+        `num_samples` distinct ranks drawn uniformly, in increasing order, or
+        all of them if there are not that many paths.
+        """
+        total = self.num_paths(source)
+        if num_samples >= total:
+            return list(range(total))
+        rng = random.Random(seed)
+        if total <= sys.maxsize:
+            return sorted(rng.sample(range(total), num_samples))
+        # Too many paths for `range` to have a length; the samples are then a
+        # vanishing fraction of them, so a repeated draw is almost never made.
+        ranks = set()
+        while len(ranks) < num_samples:
+            ranks.add(rng.randrange(total))
+        return sorted(ranks)
@@ -0,0 +1,231 @@
+"""
+Compact binary alternative to the text `.edge` file.
+
+A text `.edge` line is `node action node action node ... \\n`, repeating every
+action name and every 64-bit TLC fingerprint in decimal. The binary file
+stores the same steps as small integers. All integers are little-endian.
+
+Header, 64 bytes:
+
+    magic           8 bytes   b'TLAPATHS'
+    version         u32       FORMAT_VERSION
+    reserved        u32       0
+    num_paths       u64
+    num_nodes       u64
+    num_actions     u64
+    actions_offset  u64       start of the action table
+    nodes_offset    u64       start of the node table
+    index_offset    u64       start of the path index
+
+Path records follow the header, one per path, in the order they were
+written. A record is a varint byte length followed by:
+
+    varint  number of steps (actions) in the path
+    varint  zigzag(index of the first node)
+    then per step:
+        varint  action id
+        varint  zigzag(node index - index of the previous node)
+
+Varints are unsigned LEB128. Node indices are dense and assigned in order of
+first appearance in the file; zigzag maps 0, -1, 1, -2, ... to 0, 1, 2, 3, ...
+
+Tables, after the last record:
+
+    action table    per action id: varint byte length, UTF-8 name
+    node table      num_nodes x i64, the TLC fingerprint of each node index
+    path index      num_paths x u64, the file offset of each record
+
+`PathReader` gives random access through the index and streams paths back as
+the same alternating `(node_id, action, node_id, ...)` tuples that
+`PathWriter.write_path` takes.
+"""
+import mmap
+import struct
+import sys
+import time
+from array import array
+
+MAGIC = b'TLAPATHS'
+FORMAT_VERSION = 1
+SUFFIX = '.bin'
+_header = struct.Struct('<8sIIQQQQQQ')
+
+# Records are buffered in memory and written out in batches of this size.
+WRITE_BUFFER_SIZE = 1 << 22
+
+
+def _append_varint(buffer: bytearray, value: int):
+    while value > 0x7f:
+        buffer.append((value & 0x7f) | 0x80)
+        value >>= 7
+    buffer.append(value)
+
+
+def _read_varint(data, pos: int) -> tuple[int, int]:
+    result = 0
+    shift = 0
+    while True:
+        byte = data[pos]
+        pos += 1
+        result |= (byte & 0x7f) << shift
+        if byte < 0x80:
+            return result, pos
+        shift += 7
+
+
+def _zigzag(value: int) -> int:
+    return value << 1 if value >= 0 else (-value << 1) - 1
+
+
+def _unzigzag(value: int) -> int:
+    return value >> 1 if not value & 1 else -((value + 1) >> 1)
+
+
+class PathWriter:
+    def __init__(self, path: str):
+        self.path = path
+        self.file = open(path, 'w+b')
+        self.file.write(bytes(_header.size))
+        self.buffer = bytearray()
+        self.record = bytearray()
+        self.offsets = array('Q')
+        self.offset = _header.size
+        self.node_indices: dict[int, int] = {}
+        self.node_ids = array('q')
+        self.action_ids: dict[str, int] = {}
+        self.bytes_written = 0
+        self.bytes_stored = 0
+        self.start_time = time.time()
+        self.elapsed = None
+
+    def _node_index(self, node_id: int) -> int:
+        index = self.node_indices.get(node_id)
+        if index is None:
+            index = self.node_indices[node_id] = len(self.node_ids)
+            self.node_ids.append(node_id)
+        return index
+
+    def write_path(self, steps):
+        """Append a path given as `(node_id, action, node_id, ..., node_id)`."""
+        record = self.record
+        record.clear()
+        _append_varint(record, len(steps) // 2)
+        prev = self._node_index(steps[0])
+        _append_varint(record, _zigzag(prev))
+        action_ids = self.action_ids
+        for i in range(1, len(steps), 2):
+            action = action_ids.get(steps[i])
+            if action is None:
+                action = action_ids[steps[i]] = len(action_ids)
+            _append_varint(record, action)
+            node = self._node_index(steps[i + 1])
+            _append_varint(record, _zigzag(node - prev))
+            prev = node
+        self.offsets.append(self.offset)
+        buffer = self.buffer
+        length = len(buffer)
+        _append_varint(buffer, len(record))
+        buffer += record
+        self.offset += len(buffer) - length
+        if len(buffer) >= WRITE_BUFFER_SIZE:
+            self.file.write(buffer)
+            buffer.clear()
+
+    def close(self):
+        if self.file.closed:
+            return
+        file = self.file
+        file.write(self.buffer)
+        self.buffer.clear()
+        actions_offset = file.tell()
+        table = bytearray()
+        for action in self.action_ids:
+            name = action.encode()
+            _append_varint(table, len(name))
+            table += name
+        file.write(table)
+        nodes_offset = file.tell()
+        file.write(self.node_ids.tobytes() if sys.byteorder == 'little' else _swapped(self.node_ids))
+        index_offset = file.tell()
+        file.write(self.offsets.tobytes() if sys.byteorder == 'little' else _swapped(self.offsets))
+        self.bytes_written = self.bytes_stored = file.tell()
+        file.seek(0)
+        file.write(_header.pack(MAGIC, FORMAT_VERSION, 0, len(self.offsets), len(self.node_ids),
+                                len(self.action_ids), actions_offset, nodes_offset, index_offset))
+        file.close()
+        self.elapsed = time.time() - self.start_time
+
+    def summary(self) -> str:
+        elapsed = self.elapsed if self.elapsed is not None else time.time() - self.start_time
+        throughput = self.bytes_written / elapsed / (1 << 20) if elapsed > 0 else 0.0
+        return f"{self.path}: {self.bytes_written} bytes, {len(self.offsets)} paths, {throughput:.1f} MiB/s"
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def _swapped(values: array) -> bytes:
+    values = array(values.typecode, values)
+    values.byteswap()
+    return values.tobytes()
+
+
+class PathReader:
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, 'rb') as file:
+            self.data = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        if len(self.data) < _header.size:
+            raise ValueError(f"{path} is not a binary path file")
+        (magic, version, _, self.num_paths, num_nodes, num_actions,
+         actions_offset, nodes_offset, index_offset) = _header.unpack_from(self.data)
+        if magic != MAGIC or version != FORMAT_VERSION:
+            raise ValueError(f"{path} is not a version {FORMAT_VERSION} binary path file")
+        pos = actions_offset
+        self.action_names = []
+        for _ in range(num_actions):
+            length, pos = _read_varint(self.data, pos)
+            self.action_names.append(self.data[pos:pos + length].decode())
+            pos += length
+        self.node_ids = array('q', self.data[nodes_offset:nodes_offset + 8 * num_nodes])
+        self.offsets = array('Q', self.data[index_offset:index_offset + 8 * self.num_paths])
+        if sys.byteorder != 'little':
+            self.node_ids.byteswap()
+            self.offsets.byteswap()
+
+    def __len__(self) -> int:
+        return self.num_paths
+
+    def _decode(self, pos: int) -> tuple:
+        data = self.data
+        _, pos = _read_varint(data, pos)
+        num_steps, pos = _read_varint(data, pos)
+        node, pos = _read_varint(data, pos)
+        node = _unzigzag(node)
+        node_ids = self.node_ids
+        action_names = self.action_names
+        steps = [node_ids[node]]
+        for _ in range(num_steps):
+            action, pos = _read_varint(data, pos)
+            delta, pos = _read_varint(data, pos)
+            node += _unzigzag(delta)
+            steps.append(action_names[action])
+            steps.append(node_ids[node])
+        return tuple(steps)
+
+    def __getitem__(self, i: int) -> tuple:
+        if i < 0:
+            i += self.num_paths
+        if not 0 <= i < self.num_paths:
+            raise IndexError(i)
+        return self._decode(self.offsets[i])
+
+    def __iter__(self):
+        for offset in self.offsets:
+            yield self._decode(offset)
+
+    def close(self):
+        self.data.close()
@@ -0,0 +1,143 @@
+import bisect
+import mmap
+import os
+import struct
+from array import array
+
+INDEX_SUFFIX = '.idx'
+# magic, size and mtime of the indexed file, number of entries
+_header = struct.Struct('<8sQqQ')
+LINE_INDEX_MAGIC = b'TLALIDX1'
+NODE_INDEX_MAGIC = b'TLANIDX1'
+
+# Indexed files are scanned in batches of lines of about this many bytes.
+SCAN_CHUNK = 1 << 22
+
+
+def _source_stamp(path: str) -> tuple[int, int]:
+    stat = os.stat(path)
+    return stat.st_size, stat.st_mtime_ns
+
+
+def _write_index(path: str, magic: bytes, count: int, *sections: array):
+    size, mtime_ns = _source_stamp(path)
+    tmp_path = f'{path}{INDEX_SUFFIX}.tmp{os.getpid()}'
+    try:
+        with open(tmp_path, 'wb') as index_file:
+            index_file.write(_header.pack(magic, size, mtime_ns, count))
+            for section in sections:
+                index_file.write(section)
+        os.replace(tmp_path, path + INDEX_SUFFIX)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def write_line_index(path: str, offsets: array):
+    """Record the byte offset of every line of `path`, e.g. of each path in a .edge file."""
+    _write_index(path, LINE_INDEX_MAGIC, len(offsets), array('Q', offsets))
+
+
+def write_node_index(path: str, node_ids, offsets: array):
+    """
+    Record the byte offset of every node's line in a .node file, sorted by node
+    id. `offsets[i]` is the offset of the line of `node_ids[i]`.
+    """
+    order = sorted(range(len(offsets)), key=node_ids.__getitem__)
+    _write_index(path, NODE_INDEX_MAGIC, len(order),
+                 array('q', (node_ids[i] for i in order)), array('Q', (offsets[i] for i in order)))
+
+
+def scan_lines(path: str):
+    """Yield `(offset, line)` for every line of `path`."""
+    offset = 0
+    with open(path, 'rb') as file:
+        while (lines := file.readlines(SCAN_CHUNK)):
+            for line in lines:
+                yield offset, line
+                offset += len(line)
+
+
+def _open_index(path: str, magic: bytes):
+    """Map a current index of `path`, or return None if it is missing or stale."""
+    try:
+        with open(path + INDEX_SUFFIX, 'rb') as index_file:
+            buffer = mmap.mmap(index_file.fileno(), 0, access=mmap.ACCESS_READ)
+    except (OSError, ValueError):
+        return None
+    if len(buffer) < _header.size:
+        return None
+    index_magic, size, mtime_ns, count = _header.unpack_from(buffer)
+    if index_magic != magic or (size, mtime_ns) != _source_stamp(path):
+        return None
+    return buffer, count
+
+
+class _MappedFile:
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, 'rb') as file:
+            self.size = os.fstat(file.fileno()).st_size
+            # mmap refuses empty files.
+            self.data = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) if self.size else b''
+
+
+class LineIndex(_MappedFile):
+    """Random access to the lines of a text file through its `.idx` sidecar."""
+
+    def __init__(self, path: str):
+        super().__init__(path)
+        if (index := _open_index(path, LINE_INDEX_MAGIC)) is not None:
+            buffer, count = index
+            self.offsets = memoryview(buffer)[_header.size:_header.size + 8 * count].cast('Q')
+            return
+        self.offsets = array('Q', (offset for offset, _ in scan_lines(path)))
+        try:
+            write_line_index(path, self.offsets)
+        except OSError as e:
+            print(f'Could not save index of {path}: {e}')
+
+    def __len__(self) -> int:
+        return len(self.offsets)
+
+    def line(self, i: int) -> bytes:
+        start = self.offsets[i]
+        end = self.offsets[i + 1] if i + 1 < len(self.offsets) else self.size
+        return self.data[start:end]
+
+
+class NodeIndex(_MappedFile):
+    """Look up lines of a .node file by node id through its `.idx` sidecar."""
+
+    def __init__(self, path: str):
+        super().__init__(path)
+        if (index := _open_index(path, NODE_INDEX_MAGIC)) is not None:
+            buffer, count = index
+            view = memoryview(buffer)
+            self.node_ids = view[_header.size:_header.size + 8 * count].cast('q')
+            self.offsets = view[_header.size + 8 * count:_header.size + 16 * count].cast('Q')
+            return
+        node_ids = array('q')
+        offsets = array('Q')
+        for offset, line in scan_lines(path):
+            node_ids.append(int(line[:line.index(b' ')]))
+            offsets.append(offset)
+        order = sorted(range(len(offsets)), key=node_ids.__getitem__)
+        self.node_ids = array('q', (node_ids[i] for i in order))
+        self.offsets = array('Q', (offsets[i] for i in order))
+        try:
+            _write_index(path, NODE_INDEX_MAGIC, len(order), self.node_ids, self.offsets)
+        except OSError as e:
+            print(f'Could not save index of {path}: {e}')
+
+    def line(self, node_id: int) -> bytes:
+        i = bisect.bisect_left(self.node_ids, node_id)
+        if i == len(self.node_ids) or self.node_ids[i] != node_id:
+            raise KeyError(node_id)
+        start = self.offsets[i]
+        end = self.data.find(b'\n', start)
+        return self.data[start:self.size if end < 0 else end + 1]
+
+    def label(self, node_id: int) -> str:
+        line = self.line(node_id)
+        return line[line.index(b' ') + 1:].decode()
@@ -1,30 +1,52 @@
 import codecs
 import sys
-import linecache
 import os.path as osp
 
+import pathformat
+import pathindex
+
+
+def parse_line_ids(args):
+    """Path ids are 1-based line numbers of paths.edge; `A-B` is an inclusive range, `-` reads ids from stdin."""
+    for arg in args:
+        if arg == '-':
+            yield from parse_line_ids(sys.stdin.read().split())
+        elif '-' in arg[1:]:
+            first, last = arg.split('-', 1)
+            yield from range(int(first), int(last) + 1)
+        else:
+            yield int(arg)
+
+
+def open_paths(log_dir):
+    """Return `(number of paths, function from 0-based index to the elements of its edge line)`."""
+    edge_path = osp.join(log_dir, 'paths.edge')
+    if not osp.exists(edge_path) and osp.exists(edge_path + pathformat.SUFFIX):
+        reader = pathformat.PathReader(edge_path + pathformat.SUFFIX)
+        return len(reader), lambda i: [str(step) for step in reader[i]] + ['\n']
+    lines = pathindex.LineIndex(edge_path)
+    return len(lines), lambda i: lines.line(i).decode().split(' ')
+
+
 log_dir = sys.argv[1]
-line_ids = [int(line_id) for line_id in sys.argv[2:]]
-nodes = {}
-for line in open(osp.join(log_dir, 'paths.node')).readlines():
-    split = line.index(' ')
-    node_id = line[:split]
-    node_label = line[split+1:]
-    nodes[node_id] = node_label
-
-for line_id in line_ids:
-    line = linecache.getline(osp.join(log_dir, 'paths.edge'), line_id)
-    elements = line.split(' ')
+nodes = pathindex.NodeIndex(osp.join(log_dir, 'paths.node'))
+num_paths, get_path = open_paths(log_dir)
+
+for line_id in parse_line_ids(sys.argv[2:]):
+    if not 1 <= line_id <= num_paths:
+        print(f"Path {line_id} is out of range, there are {num_paths} paths", file=sys.stderr)
+        continue
+    elements = get_path(line_id - 1)
     result = []
     for element in elements:
         if element.isnumeric() or (element[0] == '-' and element[1:].isnumeric()):
-            label = codecs.decode(nodes[element], 'unicode_escape')
+            label = codecs.decode(nodes.line(int(element)).split(b' ', 1)[1], 'unicode_escape')
             label = element + '\n\t' + '\n\t'.join(label.split('\n'))
             result.append(label)
         else:
             result.append(element)
-            
+
     print(f"========================= {line_id} =========================")
     for result_line in result:
         print(result_line)
-    print('\n')
\ No newline at end of file
+    print('\n')
@@ -0,0 +1,135 @@
+"""
+Throttled progress reporting for hot loops.
+
+Loops only bump plain counters, either the `completed` attribute of a
+`Progress` or counters of their own that the `Progress` is given a function
+to read. A reporter thread reads them every `interval` seconds and draws a
+rich progress bar (mode `bar`) or prints a plain line (mode `log`, for logs
+and pipes). With mode `off`, or `disable=True` for a single bar, no thread
+is started at all. Mode `auto` picks `bar` when stdout is a terminal.
+
+    with Progress("Writing paths", total=n, completed=lambda: finder.num_paths):
+        ...
+"""
+import sys
+import threading
+import time
+from typing import Callable, Iterable
+
+from rich.progress import Progress as RichProgress
+from rich.progress import BarColumn, DownloadColumn, MofNCompleteColumn, TextColumn, TimeElapsedColumn, \
+    TimeRemainingColumn
+
+MODES = ('auto', 'bar', 'log', 'off')
+# Seconds between updates, by mode.
+DEFAULT_INTERVALS = {'bar': 0.1, 'log': 10.0}
+
+_mode = 'auto'
+_interval = None
+
+
+def configure(mode: str = None, interval: float = None):
+    """Set the mode and update interval of the bars created from now on."""
+    global _mode, _interval
+    if mode is not None:
+        if mode not in MODES:
+            raise ValueError(f"Unknown progress mode {mode!r}, expected one of {', '.join(MODES)}")
+        _mode = mode
+    if interval is not None:
+        _interval = interval
+
+
+def current_mode() -> str:
+    if _mode == 'auto':
+        return 'bar' if sys.stdout.isatty() else 'log'
+    return _mode
+
+
+class Progress:
+    """
+    A progress bar of `description` against `total` (None when unknown).
+    `completed` and `detail` are called from the reporter thread to read the
+    current count and an extra text; without `completed`, the `completed`
+    attribute is shown. `bytes` shows the counts as sizes.
+    """
+
+    def __init__(self, description: str, total: int = None, completed: Callable[[], int] = None,
+                 detail: Callable[[], str] = None, bytes: bool = False, disable: bool = False):
+        self.description = description
+        self.total = total
+        self.completed = 0
+        self.read_completed = completed
+        self.read_detail = detail
+        self.bytes = bytes
+        self.mode = 'off' if disable else current_mode()
+        self.interval = _interval or DEFAULT_INTERVALS.get(self.mode)
+        self.start_time = None
+        self._stopped = threading.Event()
+        self._thread = None
+        self._bar = None
+
+    def advance(self, n: int = 1):
+        self.completed += n
+
+    def track(self, iterable: Iterable) -> Iterable:
+        for item in iterable:
+            yield item
+            self.completed += 1
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def start(self):
+        self.start_time = time.time()
+        if self.mode == 'off':
+            return
+        if self.mode == 'bar':
+            if self.total is None:
+                count = TextColumn("{task.completed}")
+            else:
+                count = DownloadColumn() if self.bytes else MofNCompleteColumn()
+            columns = [TextColumn(self.description), BarColumn(), count, TextColumn("{task.fields[detail]}"),
+                       TimeElapsedColumn()]
+            if self.total is not None:
+                columns.append(TimeRemainingColumn())
+            self._bar = RichProgress(*columns, auto_refresh=False)
+            self._task_id = self._bar.add_task(self.description, total=self.total, detail='')
+            self._bar.start()
+        self._stopped.clear()
+        self._thread = threading.Thread(target=self._report_loop, name='progress', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        if self._thread is None:
+            return
+        self._stopped.set()
+        self._thread.join()
+        self._thread = None
+        self.report()
+        if self._bar is not None:
+            self._bar.stop()
+            self._bar = None
+
+    def _report_loop(self):
+        while not self._stopped.wait(self.interval):
+            self.report()
+
+    def report(self):
+        completed = self.completed if self.read_completed is None else self.read_completed()
+        detail = '' if self.read_detail is None else self.read_detail()
+        if self._bar is not None:
+            self._bar.update(self._task_id, completed=completed, detail=detail, refresh=True)
+            return
+        if self.total is None:
+            count = f"{completed}"
+        else:
+            count = f"{completed}/{self.total} ({completed / max(self.total, 1):.0%})"
+        if self.bytes:
+            count += " bytes"
+        if detail:
+            count += " " + detail
+        print(f"{self.description}: {count}, {time.time() - self.start_time:.0f}s elapsed", flush=True)
@@ -1,11 +1,16 @@
-import codecs
-import copy
+import functools
 import re
 from lib import *
-from extractor import ProtocolObject
+from extractor import ProtocolObject, register
+from tlastate import MESSAGE_CACHE_SIZE, STATE_CACHE_SIZE, get_variable
+import tlavalue
+
+
+_entry_pattern = re.compile(r"\[term\|->(\d+),value\|->(\d+)\]")
 
 
 class RaftEntry(ProtocolObject):
+    __slots__ = ('term', 'value')
     term: int
     value: int
 
@@ -17,7 +22,7 @@ class RaftEntry(ProtocolObject):
     def parse(entries: str) -> list['RaftEntry']:
         if entries == "" or entries is None:
             return None
-        matched = re.findall(r"\[term\|->(\d+),value\|->(\d+)\]", entries)
+        matched = _entry_pattern.findall(entries)
         if matched is None:
             raise Exception(f"Error parsing entries: {entries}")
         res = []
@@ -25,12 +30,49 @@ class RaftEntry(ProtocolObject):
             res.append(RaftEntry(term=int(ent[0]), value=int(ent[1])))
         return res
 
-    def to_dict(self):
-        d = {k: v for k, v in self.__dict__.items() if v is not None}
-        return d
-    
-    
+
+# Message type, pattern and the fields set from its groups, by the `mtype` tag
+# a message starts with.
+_message_formats = {
+    # mentries format: <<[term |-> 1, value |-> 1], [term |-> 1, value |-> 2]>>
+    'AE': ("AppendEntriesRequest",
+           re.compile(r"\[mtype\|->AE,mterm\|->(\d+),msource\|->(\d+),mdest\|->(\d+),mprevLogIndex\|->(\d+),mprevLogTerm\|->(\d+),mentries\|-><<(.*)>>,mlog\|-><<.*>>,mcommitIndex\|->(\d+)\]"),
+           ('mterm', 'msource', 'mdest', 'mindex', 'mindex_term', 'mentries', 'mcommit_index')),
+    'AER': ("AppendEntriesResponse",
+            re.compile(r"\[mtype\|->AER,mterm\|->(\d+),msource\|->(\d+),mdest\|->(\d+),msuccess\|->(TRUE|FALSE),mmatchIndex\|->(\d+)\]"),
+            ('mterm', 'msource', 'mdest', 'msuccess', 'mmatch_index')),
+    'RV': ("RequestVoteRequest",
+           re.compile(r"\[mtype\|->RV,mterm\|->(\d+),mlastLogTerm\|->(\d+),mlastLogIndex\|->(\d+),msource\|->(\d+),mdest\|->(\d+)\]"),
+           ('mterm', 'mindex_term', 'mindex', 'msource', 'mdest')),
+    'RVR': ("RequestVoteResponse",
+            re.compile(r"\[mtype\|->RVR,mterm\|->(\d+),msource\|->(\d+),mdest\|->(\d+),mlog\|-><<.*>>,mvoteGranted\|->(TRUE|FALSE)\]"),
+            ('mterm', 'msource', 'mdest', 'msuccess')),
+}
+_field_parsers = {
+    'msuccess': lambda value: value == "TRUE",
+    'mentries': RaftEntry.parse,
+}
+_mtype_prefix = '[mtype|->'
+
+
+@functools.lru_cache(maxsize=MESSAGE_CACHE_SIZE)
+def _parse_message_fields(message: str) -> dict:
+    """The fields of a message, or None if it is not one of `_message_formats`. Must not be modified."""
+    if message.startswith(_mtype_prefix):
+        message_format = _message_formats.get(message[len(_mtype_prefix):message.find(',')])
+        if message_format is not None:
+            mtype, pattern, names = message_format
+            if (matched := pattern.match(message)) is not None:
+                fields = {'mtype': mtype}
+                for name, value in zip(names, matched.groups()):
+                    fields[name] = _field_parsers.get(name, int)(value)
+                return fields
+    return None
+
+
 class RaftMessage(ProtocolObject):
+    __slots__ = ('mtype', 'mterm', 'mindex', 'mindex_term', 'msuccess', 'mentries', 'mcommit_index',
+                 'mmatch_index', 'msource', 'mdest', 'mreq_id', 'count')
     mtype: str
     mterm: int
     mindex: int
@@ -76,68 +118,28 @@ class RaftMessage(ProtocolObject):
             res.mtype = "ClientResponse"
             res.msource = kwargs['source']
             return res
-        elif (matched := re.match(r"\[mtype\|->AE,mterm\|->(\d+),msource\|->(\d+),mdest\|->(\d+),mprevLogIndex\|->(\d+),mprevLogTerm\|->(\d+),mentries\|-><<(.*)>>,mlog\|-><<.*>>,mcommitIndex\|->(\d+)\]", message)) is not None:
-            #                                                                1                2              3                      4                     5                  6                                      7
-            # mentries format: <<[term |-> 1, value |-> 1], [term |-> 1, value |-> 2]>>
-            res.mtype = "AppendEntriesRequest"
-            res.mterm = int(matched.group(1))
-            res.msource = int(matched.group(2))
-            res.mdest = int(matched.group(3))
-            res.mindex = int(matched.group(4))
-            res.mindex_term = int(matched.group(5))
-            res.mentries = RaftEntry.parse(matched.group(6))
-            res.mcommit_index = int(matched.group(7))
-        elif (matched := re.match(r"\[mtype\|->AER,mterm\|->(\d+),msource\|->(\d+),mdest\|->(\d+),msuccess\|->(TRUE|FALSE),mmatchIndex\|->(\d+)\]", message)) is not None:
-            #                                                                   1                 2              3                4                    5
-            res.mtype = "AppendEntriesResponse"
-            res.mterm = int(matched.group(1))
-            res.msource = int(matched.group(2))
-            res.mdest = int(matched.group(3))
-            res.msuccess = True if (matched.group(4)) == "TRUE" else False
-            res.mmatch_index = int(matched.group(5))
-        elif (matched := re.match(r"\[mtype\|->RV,mterm\|->(\d+),mlastLogTerm\|->(\d+),mlastLogIndex\|->(\d+),msource\|->(\d+),mdest\|->(\d+)\]", message)) is not None:
-            #                                                               1                      2                      3                4              5
-            res.mtype = "RequestVoteRequest"
-            res.mterm = int(matched.group(1))
-            res.mindex_term = int(matched.group(2))
-            res.mindex = int(matched.group(3))
-            res.msource = int(matched.group(4))
-            res.mdest = int(matched.group(5))
-        elif (matched := re.match(r"\[mtype\|->RVR,mterm\|->(\d+),msource\|->(\d+),mdest\|->(\d+),mlog\|-><<.*>>,mvoteGranted\|->(TRUE|FALSE)\]", message)) is not None:
-            #                                                                 1                 2             3                                      4
-            res.mtype = "RequestVoteResponse"
-            res.mterm = int(matched.group(1))
-            res.msource = int(matched.group(2))
-            res.mdest = int(matched.group(3))
-            res.msuccess = True if (matched.group(4)) == "TRUE" else False
-        else:
+        elif (fields := _parse_message_fields(message)) is None:
             raise NotImplementedError(f"Parsing for {message=}, {hint=} is not implemented yet.")
+        for name, value in fields.items():
+            setattr(res, name, value)
+        if res.mentries is not None:
+            res.mentries = list(res.mentries)
         return res
     
-    def to_dict(self):
-        d = {k: v for k, v in self.__dict__.items() if v is not None}
-        if self.mentries is not None:
-            d['mentries'] = [entry.to_dict() for entry in self.mentries]
-        return d
-    
 
 def get_messages_from_state(state, messages_name=None) -> dict[str, int]:
+    """`{message: count}` of a state, uncached; the extractor uses `RaftExtractor.get_message_bag`."""
     if messages_name is None:
         messages_name = 'messages'
-    messages = [variable for variable in codecs.decode(state, 'unicode_escape').split('/\\') if variable.startswith(f' {messages_name}')][0].replace('\n', '').replace(' ', '')
-    if (matched := re.match(f'{messages_name}=<<>>', messages)) is not None:
-        return {}
-    elif (matched := re.match(f'{messages_name}=\((.*?)\)', messages)) is not None:
-        messages = matched.group(1)
-    else:
-        raise Exception(f"Error parsing messages: {messages}")
-    messages = messages.split('@@')
-    messages = [message_count.split(":>") for message_count in messages]
-    messages = {message_count[0]: int(message_count[1]) for message_count in messages}
-    return messages
-
-def get_messages_diff(prev_node_messages, node_messages) -> dict[str, int]:
-    diff = copy.deepcopy(node_messages)
+    messages = get_variable(state, messages_name)
+    try:
+        return {message: int(count) for message, count in tlavalue.function(messages)}
+    except ValueError as e:
+        raise Exception(f"Error parsing messages: {messages}") from e
+
+def get_messages_diff(prev_node_messages, node_messages) -> dict:
+    """Change of the message counts, keyed like the arguments (message texts or ids)."""
+    diff = dict(node_messages)
     for message in prev_node_messages:
         if message in diff:
             diff[message] = diff[message] - prev_node_messages[message]
@@ -152,25 +154,36 @@ def get_log_from_state(state) -> list[str]:
     # Examples:
     # log = <<<<[term |-> 1, value |-> 1]>>, <<>>, <<>>>>
     # log = <<<<>>, <<>>, <<>>>>
-    log = [variable for variable in codecs.decode(state, 'unicode_escape').split('/\\') if variable.startswith(' log')][0].replace('\n', '').replace(' ', '')
-    if (matched:=re.match(r'log=<<(.+)>>', log)) is not None:
-        log_by_node = re.findall(r'(<<.*?>>)', matched.group(1))
-        return log_by_node
-    else:
-        raise Exception(f"Error parsing log: {log}") 
+    log = get_variable(state, 'log')
+    try:
+        return tlavalue.sequence(log)
+    except ValueError as e:
+        raise Exception(f"Error parsing log: {log}") from e
     
 def get_responsed_client_requests_from_state(state) -> list[list[int]]:
-    responsed_client_requests = [variable for variable in codecs.decode(state, 'unicode_escape').split('/\\') if variable.startswith(' responsedClientRequests')][0].replace('\n', '').replace(' ', '')
-    if (matched:=re.match(r'responsedClientRequests=<<(.+)>>', responsed_client_requests)) is not None:
-        responsed_by_node = re.findall(r'\{(.*?)\}', matched.group(1))
-        responsed_by_node = [[int(i) for i in r.split(',') if i != ''] for r in responsed_by_node]
-        return responsed_by_node
-    else:
-        raise Exception(f"Error parsing responsedClientRequests: {responsed_client_requests}")
+    responsed_client_requests = get_variable(state, 'responsedClientRequests')
+    try:
+        return [[int(i) for i in tlavalue.set_items(r)] for r in tlavalue.sequence(responsed_client_requests)]
+    except ValueError as e:
+        raise Exception(f"Error parsing responsedClientRequests: {responsed_client_requests}") from e
         
+@register('raft')
 class RaftExtractor(Extractor):
     def __init__(self):
-        ...
+        # Messages of the states seen by this extractor by id; a state's message
+        # bag is kept as {id: count}. Both go away with the extractor.
+        self.intern_message = tlavalue.Interner()
+        self.get_message_bag = functools.lru_cache(maxsize=STATE_CACHE_SIZE)(self._get_message_bag)
+
+    def _get_message_bag(self, messages: str) -> dict[int, int]:
+        """`{message id: count}` of a `messages` value, in its order. Cached per value; must not be modified."""
+        try:
+            return {self.intern_message(message): int(count) for message, count in tlavalue.function(messages)}
+        except ValueError as e:
+            raise Exception(f"Error parsing messages: {messages}") from e
+
+    def get_message_bag_from_state(self, state) -> dict[int, int]:
+        return self.get_message_bag(get_variable(state, 'messages'))
     
     # @override
     def extract(self, action, prev_state, cur_state) -> dict:
@@ -208,10 +221,11 @@ class RaftExtractor(Extractor):
                     diffs.extend(diff)
             return {"action": action, "diff": diffs}
         else:
-            prev_node_messages = get_messages_from_state(prev_state)
-            node_messages = get_messages_from_state(cur_state)
+            prev_node_messages = self.get_message_bag_from_state(prev_state)
+            node_messages = self.get_message_bag_from_state(cur_state)
             diffs = get_messages_diff(prev_node_messages, node_messages)
-            diffs = [RaftMessage.parse(message, count) for message, count in diffs.items()]
+            messages = self.intern_message.texts
+            diffs = [RaftMessage.parse(messages[message], count) for message, count in diffs.items()]
             return {"action": action, "diff": diffs}
 
 
@@ -0,0 +1,145 @@
+"""
+Binary sidecar files: a JSON header followed by memory-mapped array sections.
+
+Used by the graph cache (`csrgraph`) and the diff table (`difftable`). Layout,
+native byte order for the sections:
+
+    prelude     magic (8 bytes), version u32, header length u32, header crc32 u32
+    header      JSON: the caller's fields, plus `byteorder`, `data_size` and
+                `sections`: {name: [offset, byte length, typecode, crc32]}
+    (padding to a multiple of 8)
+    sections    each 8-byte aligned; offsets are relative to the end of the padding
+
+Sections are checked against their crc32 when the file is opened, so a
+corrupt file is refused instead of being served. Large byte sections that
+are read piecemeal, like the labels of the graph cache, can be written as
+`lazy`: their crc32 in the header is null, and a `<name>.crc32` section
+holds the crc32 of each BLOCK_SIZE block instead. Such a section is read
+back as a `BlockChecked`, which checks a block the first time a slice
+touches it, so opening the file does not page the whole section in.
+"""
+import json
+import mmap
+import os
+import struct
+import sys
+import zlib
+from array import array
+
+_prelude = struct.Struct('<8sIII')  # magic, version, header length, header crc32
+BLOCK_SIZE = 1 << 20
+
+
+def _block_crcs(view: memoryview) -> array:
+    return array('I', (zlib.crc32(view[start:start + BLOCK_SIZE]) for start in range(0, len(view), BLOCK_SIZE)))
+
+
+def write(path: str, magic: bytes, version: int, header: dict, sections: dict, lazy=()):
+    """
+    Write `header` and the buffers of `sections` to `path`, through a
+    temporary file. The sections named in `lazy` must be bytes-like and are
+    checked block by block when read.
+    """
+    header = dict(header, byteorder=sys.byteorder, sections={})
+    views = {}
+    for name, section in sections.items():
+        views[name] = memoryview(section)
+        if name in lazy:
+            views[name + '.crc32'] = memoryview(_block_crcs(views[name].cast('B')))
+    offset = 0
+    for name, view in views.items():
+        offset += -offset % 8
+        crc = None if name in lazy else zlib.crc32(view.cast('B'))
+        header['sections'][name] = [offset, view.nbytes, view.format, crc]
+        offset += view.nbytes
+    header['data_size'] = offset
+    encoded = json.dumps(header).encode()
+    tmp_path = f'{path}.tmp{os.getpid()}'
+    try:
+        with open(tmp_path, 'wb') as sidecar_file:
+            sidecar_file.write(_prelude.pack(magic, version, len(encoded), zlib.crc32(encoded)))
+            sidecar_file.write(encoded)
+            data_start = sidecar_file.tell() + -sidecar_file.tell() % 8
+            for name, view in views.items():
+                offset = data_start + header['sections'][name][0]
+                sidecar_file.write(bytes(offset - sidecar_file.tell()))
+                sidecar_file.write(view)
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def read(path: str, magic: bytes, version: int) -> tuple[dict, dict, mmap.mmap]:
+    """
+    Map a file written by `write`, returning its header, its sections as
+    memoryviews of their typecode and the mmap backing them. Raises ValueError
+    if the file is not a complete, intact file of this magic and version.
+    """
+    with open(path, 'rb') as sidecar_file:
+        buffer = mmap.mmap(sidecar_file.fileno(), 0, access=mmap.ACCESS_READ)
+    if len(buffer) < _prelude.size:
+        raise ValueError("truncated file")
+    file_magic, file_version, header_length, header_crc = _prelude.unpack_from(buffer)
+    if file_magic != magic or file_version != version:
+        raise ValueError(f"unsupported format {file_magic!r} version {file_version}")
+    data_start = _prelude.size + header_length
+    encoded = buffer[_prelude.size:data_start]
+    if zlib.crc32(encoded) != header_crc:
+        raise ValueError("header checksum mismatch")
+    data_start += -data_start % 8
+    try:
+        header = json.loads(encoded)
+        if data_start + header['data_size'] != len(buffer):
+            raise ValueError("truncated file")
+        if header['byteorder'] != sys.byteorder:
+            raise ValueError(f"file was written on a {header['byteorder']}-endian machine")
+        view = memoryview(buffer)
+        sections = {}
+        lazy = []
+        for name, (offset, length, typecode, crc) in header['sections'].items():
+            section = view[data_start + offset:data_start + offset + length]
+            if crc is None:
+                lazy.append(name)
+            elif zlib.crc32(section) != crc:
+                raise ValueError(f"checksum mismatch in section {name}")
+            sections[name] = section.cast(typecode)
+        for name in lazy:
+            crcs = sections.pop(name + '.crc32')
+            if len(crcs) != -(-len(sections[name]) // BLOCK_SIZE):
+                raise ValueError(f"wrong number of block checksums for section {name}")
+            sections[name] = BlockChecked(f"section {name} of {path}", sections[name], crcs)
+    except (KeyError, TypeError) as e:
+        raise ValueError(f"malformed header: {e!r}")
+    return header, sections, buffer
+
+
+class BlockChecked:
+    """
+    A byte section sliced like a memoryview, checking each BLOCK_SIZE block
+    against its crc32 the first time a slice touches it. A corrupt block
+    raises ValueError.
+    """
+
+    def __init__(self, name: str, view: memoryview, crcs):
+        self.name = name
+        self.view = view
+        self.crcs = crcs
+        self.checked = bytearray(len(crcs))
+
+    def __len__(self) -> int:
+        return len(self.view)
+
+    def __getitem__(self, key: slice) -> memoryview:
+        start, stop, _ = key.indices(len(self.view))
+        if start < stop:
+            for block in range(start // BLOCK_SIZE, (stop - 1) // BLOCK_SIZE + 1):
+                if not self.checked[block]:
+                    self.check_block(block)
+        return self.view[key]
+
+    def check_block(self, block: int):
+        start = block * BLOCK_SIZE
+        if zlib.crc32(self.view[start:start + BLOCK_SIZE]) != self.crcs[block]:
+            raise ValueError(f"checksum mismatch in block {block} of {self.name}; delete the file to rebuild it")
+        self.checked[block] = 1
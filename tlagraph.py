@@ -1,21 +1,154 @@
+import gc
+import mmap
+import os
 import re
-import subprocess
-import rich
-from rich.progress import Progress, BarColumn, TextColumn, TimeRemainingColumn, TimeElapsedColumn, MofNCompleteColumn
-from tqdm import tqdm
+from array import array
+from collections import OrderedDict
+
+from progress import Progress
+
+# Lines are read in batches of roughly this many bytes.
+DOT_READ_CHUNK = 1 << 22
+
+NODE, EDGE, ROOT = 0, 1, 2
+
+DEFAULT_LABEL_CACHE_SIZE = 1 << 16
+
+_edge_pattern = re.compile(rb'([-\d]+) -> ([-\d]+) \[label="(.*?)",')
+_node_pattern = re.compile(rb'([-\d]+) \[label="(.*)"')
+_root_pattern = re.compile(rb'\{rank = same; ([-\d]+);\}')
+_id_first_bytes = frozenset(b'-0123456789')
+
+
+def read_dot(dot_file_path: str, label_offsets: bool = False):
+    """
+    Stream the records of a TLC dot dump in file order.
+
+    Yields `(NODE, node_id, label_bytes, None)`, `(EDGE, src_id, dst_id, action)`
+    and `(ROOT, node_id, None, None)`. Node labels are left undecoded so callers
+    can choose how to store them; action names are decoded once and shared.
+    With `label_offsets`, node records are `(NODE, node_id, start, end)`
+    instead, the byte range of the label in the file.
+    """
+    size = os.path.getsize(dot_file_path)
+    print(f'Dot file has {size} bytes')
+    actions: dict[bytes, str] = {}
+    id_first_bytes = _id_first_bytes
+    edge_match = _edge_pattern.match
+    node_match = _node_pattern.match
+    with open(dot_file_path, 'rb') as dot_file:
+        with Progress("Parsing dot file", total=size, bytes=True) as progress:
+            position = 0
+            while (lines := dot_file.readlines(DOT_READ_CHUNK)):
+                for line in lines:
+                    line_start = position
+                    position += len(line)
+                    if line[0] in id_first_bytes:
+                        # Only edge lines have `->` right after the source id; the node
+                        # pattern is still tried if that check or the edge pattern fails.
+                        if line.startswith(b'-> ', line.find(b' ') + 1) and (matched := edge_match(line)):
+                            src_id, dst_id, action = matched.groups()
+                            if (label := actions.get(action)) is None:
+                                label = actions[action] = action.decode()
+                            yield EDGE, int(src_id), int(dst_id), label
+                        elif (matched := node_match(line)):
+                            if label_offsets:
+                                yield NODE, int(matched.group(1)), line_start + matched.start(2), line_start + matched.end(2)
+                            else:
+                                node_id, label = matched.groups()
+                                yield NODE, int(node_id), label, None
+                    elif line.startswith(b'{rank') and (matched := _root_pattern.match(line)):
+                        yield ROOT, int(matched.group(1)), None, None
+                progress.completed = dot_file.tell()
+
 
 class Node:
+    __slots__ = ('node_id', 'label')
+
     def __init__(self, node_id: int, label=None):
         self.node_id = node_id
         self.label = label
 
+class LabelStore:
+    """
+    Node labels kept as byte ranges of the dot file they were read from, and
+    read back from a shared memory map on access. The last `cache_size`
+    decoded labels are kept in an LRU, since a path revisits the labels of its
+    neighbouring states.
+    """
+
+    def __init__(self, dot_file_path: str, cache_size: int = DEFAULT_LABEL_CACHE_SIZE):
+        self.dot_file_path = dot_file_path
+        self.cache_size = cache_size
+        self.starts = array('q')
+        self.ends = array('q')
+        self.cache: OrderedDict[int, str] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self._map = None
+
+    def add(self) -> int:
+        """Reserve an index for a node whose label is not known yet."""
+        self.starts.append(-1)
+        self.ends.append(-1)
+        return len(self.starts) - 1
+
+    def set(self, index: int, start: int, end: int):
+        self.starts[index] = start
+        self.ends[index] = end
+
+    def has_label(self, index: int) -> bool:
+        return self.starts[index] != -1
+
+    def get(self, index: int) -> str:
+        label = self.cache.get(index)
+        if label is not None:
+            self.cache.move_to_end(index)
+            self.hits += 1
+            return label
+        start = self.starts[index]
+        if start == -1:
+            return None
+        self.misses += 1
+        if self._map is None:
+            with open(self.dot_file_path, 'rb') as dot_file:
+                self._map = mmap.mmap(dot_file.fileno(), 0, access=mmap.ACCESS_READ)
+        label = str(self._map[start:self.ends[index]], 'utf-8')
+        if self.cache_size > 0:
+            self.cache[index] = label
+            if len(self.cache) > self.cache_size:
+                self.cache.popitem(last=False)
+        return label
+
+    def close(self):
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+
+class LazyNode:
+    """A `Node` whose label is read from a `LabelStore` when it is used."""
+    __slots__ = ('node_id', 'index', 'labels')
+
+    def __init__(self, node_id: int, index: int, labels: LabelStore):
+        self.node_id = node_id
+        self.index = index
+        self.labels = labels
+
+    @property
+    def label(self) -> str:
+        return self.labels.get(self.index)
+
 class Edge:
+    __slots__ = ('src', 'dst', 'label', 'visited')
+
     def __init__(self, src: Node, dst: Node, label: str):
         self.src = src
         self.dst = dst
         self.label = label
 
 class AdjacencyList:
+    __slots__ = ('node', 'edges', 'edges_map')
+
     def __init__(self, node: Node):
         self.node = node
         self.edges: list[Edge] = []
@@ -29,35 +162,40 @@ class AdjacencyList:
         return self.edges_map[dst_id]
 
 class TLAGraph:
-    def __init__(self):
+    def __init__(self, labels: LabelStore = None):
         self.node_ids: list[int] = []
         self.adjacency: dict[int, AdjacencyList] = {}
         self.root_id = None
+        self.labels = labels
 
     @staticmethod
-    def from_file(dot_file_path: str) -> 'TLAGraph':
-        graph = TLAGraph()
-        num_lines = int(subprocess.check_output(['wc', '-l', dot_file_path]).decode('utf-8').strip(' \t\r\n').split(' ')[0])
-        print(f'Dot file has {num_lines} lines')
-        with open(dot_file_path) as dot_file:
-            with Progress(TextColumn("Parsing dot file"), BarColumn(), MofNCompleteColumn(),
-                          TimeRemainingColumn(), TimeElapsedColumn()) as progress:
-                for _ in progress.track(range(num_lines)):
-                    line = dot_file.readline()
-                    if line == '':
-                        break
-                    # print(line)
-                    if (edge_match := re.match(r'([-\d]+) -> ([-\d]+) \[label="(.*?)",', line)):
-                        src_id = int(edge_match.group(1))
-                        dst_id = int(edge_match.group(2))
-                        label = edge_match.group(3)
-                        graph.add_edge(src_id, dst_id, label)
-                    elif (node_match := re.match(r'([-\d]+) \[label="(.*)"', line)):
-                        node_id = int(node_match.group(1))
-                        label = node_match.group(2)
-                        graph.add_node(node_id, label)
-                    elif (root_match := re.match(r'\{rank = same; ([-\d]+);\}', line)):
-                        graph.root_id = int(root_match.group(1))
+    def from_file(dot_file_path: str, lazy_labels: bool = False,
+                  label_cache_size: int = DEFAULT_LABEL_CACHE_SIZE) -> 'TLAGraph':
+        """
+        Read a dot dump. With `lazy_labels`, labels stay in the file and the
+        nodes are `LazyNode`s reading them through a `LabelStore`.
+        """
+        graph = TLAGraph(LabelStore(dot_file_path, label_cache_size) if lazy_labels else None)
+        # Nothing built here is cyclic garbage, so skip the collector passes that
+        # millions of fresh nodes and edges would otherwise trigger.
+        gc_was_enabled = gc.isenabled()
+        gc.disable()
+        try:
+            for kind, a, b, c in read_dot(dot_file_path, label_offsets=lazy_labels):
+                if kind == EDGE:
+                    graph.add_edge(a, b, c)
+                elif lazy_labels:
+                    if kind == NODE:
+                        graph.add_lazy_node(a, b, c)
+                    else:
+                        graph.root_id = a
+                elif kind == NODE:
+                    graph.add_node(a, b.decode())
+                else:
+                    graph.root_id = a
+        finally:
+            if gc_was_enabled:
+                gc.enable()
         return graph
     
     def number_of_nodes(self) -> int:
@@ -75,7 +213,15 @@ class TLAGraph:
     def get_edge(self, src_id: int, dst_id: int) -> Edge:
         return self.adjacency[src_id].get_edge(dst_id)
     
+    def _new_node(self, node_id: int) -> Node:
+        self.node_ids.append(node_id)
+        node = Node(node_id) if self.labels is None else LazyNode(node_id, self.labels.add(), self.labels)
+        self.adjacency[node_id] = AdjacencyList(node)
+        return node
+
     def add_node(self, node_id: int, label: str) -> Node:
+        if self.labels is not None:
+            raise TypeError("Nodes of a graph with lazy labels are added with add_lazy_node")
         if self.has_node(node_id):
             if self.get_node(node_id).label is not None:
                 raise RuntimeError(f"Node {node_id} with non-None label already exists")
@@ -84,15 +230,25 @@ class TLAGraph:
                 node.label = label
                 return node
         else:
-            self.node_ids.append(node_id)
-            node = Node(node_id, label)
-            self.adjacency[node_id] = AdjacencyList(node)
+            node = self._new_node(node_id)
+            node.label = label
             return node
+
+    def add_lazy_node(self, node_id: int, start: int, end: int) -> LazyNode:
+        """Add a node whose label is bytes `start:end` of the dot file of `self.labels`."""
+        if self.has_node(node_id):
+            node = self.get_node(node_id)
+            if self.labels.has_label(node.index):
+                raise RuntimeError(f"Node {node_id} with non-None label already exists")
+        else:
+            node = self._new_node(node_id)
+        self.labels.set(node.index, start, end)
+        return node
     
     def add_edge(self, src_id: str, dst_id: str, label: str) -> Edge:
         src_node = self.adjacency[src_id].node
         if dst_id not in self.adjacency:
-            self.add_node(dst_id, label=None)
+            self._new_node(dst_id)
         dst_node = self.adjacency[dst_id].node
         edge = Edge(src_node, dst_node, label)
         self.adjacency[src_id].add_edge(edge)
@@ -109,4 +265,9 @@ class TLAGraph:
     
     def num_successors(self, node_id: int) -> int:
         return len(self.adjacency[node_id].edges)
+
+    def clear_visited(self):
+        for adjacency in self.adjacency.values():
+            for edge in adjacency.edges:
+                edge.visited = False
     
\ No newline at end of file
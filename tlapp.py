@@ -0,0 +1,127 @@
+"""
+Single entry point for path generation with any registered extractor.
+
+    python3 tlapp.py generate raft state.dot paths 12 [options]
+    python3 tlapp.py batch jobs.txt [--processes N]
+    python3 tlapp.py protocols
+
+`generate` takes the protocol name followed by the arguments of
+`raft_path_generator.py`. A batch file holds one job per line in the same
+form (`#` starts a comment). Jobs run in this process, or with `--processes`
+in a pool forked after everything is imported, so interpreter startup and
+imports are paid once per batch. Pool jobs write their console output to
+`<dir>.log`.
+
+Extractors of other protocols are found by importing the modules given with
+`--plugin`, which register their `Extractor` subclasses with
+`extractor.register`.
+"""
+import argparse
+import contextlib
+import importlib
+import multiprocessing
+import shlex
+import sys
+import time
+
+import lib
+from extractor import get_extractor, protocol_names
+
+
+def job_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog='tlapp.py generate')
+    parser.add_argument('protocol', help='name of a registered extractor, e.g. raft or zk')
+    return lib.add_arguments(parser)
+
+
+def parse_job(argv: list[str]) -> argparse.Namespace:
+    return job_parser().parse_args(argv)
+
+
+def read_jobs(path: str) -> list[argparse.Namespace]:
+    jobs = []
+    with open(path) as jobs_file:
+        for line in jobs_file:
+            argv = shlex.split(line, comments=True)
+            if argv:
+                jobs.append(parse_job(argv))
+    return jobs
+
+
+def run_job(job: argparse.Namespace) -> tuple[str, int, float]:
+    """Run one job, returning its output prefix, number of paths and run time."""
+    start_time = time.time()
+    num_paths = lib.generate(job, get_extractor(job.protocol))
+    return job.dir, num_paths, time.time() - start_time
+
+
+def _run_logged_job(job: argparse.Namespace) -> tuple[str, int, float]:
+    with open(job.dir + '.log', 'w') as log_file, contextlib.redirect_stdout(log_file):
+        return run_job(job)
+
+
+def check_jobs(jobs: list[argparse.Namespace], processes: int = 1):
+    """
+    Raise before any work is done if a job names an unknown protocol, has
+    arguments that cannot run together, or asks for `--workers` on a pool,
+    whose workers cannot fork shard workers.
+    """
+    for job in jobs:
+        get_extractor(job.protocol)
+        try:
+            lib.check_arguments(job)
+        except ValueError as e:
+            raise ValueError(f"Job writing {job.dir}: {e}")
+        if processes > 1 and job.workers > 1:
+            raise ValueError(f"Job writing {job.dir} asks for --workers, which cannot run on a process pool")
+
+
+def run_jobs(jobs: list[argparse.Namespace], processes: int = 1) -> list[tuple[str, int, float]]:
+    """Run `jobs` one after another, or on a pool of `processes` forked workers."""
+    check_jobs(jobs, processes)
+    if processes <= 1:
+        return [run_job(job) for job in jobs]
+    with multiprocessing.get_context('fork').Pool(processes) as pool:
+        return pool.map(_run_logged_job, jobs, chunksize=1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Generate paths from TLC state graphs.')
+    parser.add_argument('--plugin', action='append', default=[], metavar='MODULE',
+                        help='import MODULE to register more extractors (repeatable)')
+    commands = parser.add_subparsers(dest='command', required=True)
+    commands.add_parser('generate', add_help=False,
+                        help='run one job: PROTOCOL PATH DIR STEP_LIMIT [options]')
+    batch = commands.add_parser('batch', help='run the jobs listed in a file')
+    batch.add_argument('jobs', help='file with one job per line, in the form taken by generate')
+    batch.add_argument('--processes', type=int, default=1,
+                       help='number of jobs run at once (default: %(default)s)')
+    commands.add_parser('protocols', help='list the registered extractors')
+    args, rest = parser.parse_known_args()
+    for module in args.plugin:
+        importlib.import_module(module)
+
+    if args.command == 'protocols':
+        for name in protocol_names():
+            print(name)
+        return
+    if args.command == 'generate':
+        jobs, processes = [parse_job(rest)], 1
+    else:
+        if rest:
+            parser.error(f"unrecognized arguments: {' '.join(rest)}")
+        jobs, processes = read_jobs(args.jobs), args.processes
+    try:
+        check_jobs(jobs, processes)
+    except (KeyError, ValueError) as e:
+        parser.error(e.args[0])
+    start_time = time.time()
+    results = run_jobs(jobs, processes)
+    if args.command == 'batch':
+        for dir, num_paths, elapsed in results:
+            print(f"{dir}: {num_paths} paths in {elapsed:.1f}s")
+        print(f"Ran {len(results)} jobs in {time.time() - start_time:.1f}s")
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,28 @@
+import codecs
+import functools
+
+# Consecutive edges of a path share a state, and the extractor reads several
+# variables of each, so even a small cache avoids almost every re-parse.
+STATE_CACHE_SIZE = 1 << 12
+# Distinct message texts are few next to the number of diffs written, so the
+# extractors parse each once and later parses only copy the fields.
+MESSAGE_CACHE_SIZE = 1 << 16
+
+
+@functools.lru_cache(maxsize=STATE_CACHE_SIZE)
+def parse_state(state: str) -> dict[str, str]:
+    """
+    Split a node label as written by TLC (`/\\ name = value` conjuncts with
+    escaped newlines) into `{name: value}`, with all whitespace removed from
+    the values. The result is cached per label and must not be modified.
+    """
+    variables = {}
+    for variable in codecs.decode(state, 'unicode_escape').split('/\\'):
+        name, sep, value = variable.replace('\n', '').replace(' ', '').partition('=')
+        if sep and name not in variables:
+            variables[name] = value
+    return variables
+
+
+def get_variable(state: str, name: str) -> str:
+    return parse_state(state)[name]
@@ -0,0 +1,100 @@
+"""
+Bracket-matching splitter for TLA+ values as printed by TLC, with whitespace
+removed (see `tlastate.parse_state`).
+
+Values are split one level at a time into the raw text of their items, so
+callers decide how deep to go and how to read the leaves:
+
+    sequence('<<[a|->1],<<>>>>')     == ['[a|->1]', '<<>>']
+    set_items('{1,2}')               == ['1', '2']
+    record('[a|->1,b|-><<2,3>>]')    == {'a': '1', 'b': '<<2,3>>'}
+    function('([a|->1]:>1@@[b|->2]:>2)') == [('[a|->1]', '1'), ('[b|->2]', '2')]
+
+Each call scans its text once, so nesting depth and the number of servers
+do not change the cost beyond the length of the text.
+"""
+import re
+
+_tokens = re.compile(r'<<|>>|:>|@@|[\[\]{}(),]')
+_closing = {'<<': '>>', '[': ']', '{': '}', '(': ')'}
+_closers = frozenset(_closing.values())
+
+
+def split(text: str, sep: str = ',', start: int = 0, end: int = None) -> list[str]:
+    """Split `text[start:end]` at the `sep` tokens outside any brackets."""
+    if end is None:
+        end = len(text)
+    items = []
+    expected = []
+    item_start = start
+    for match in _tokens.finditer(text, start, end):
+        token = match.group()
+        if token == sep and not expected:
+            items.append(text[item_start:match.start()])
+            item_start = match.end()
+        elif token in _closing:
+            expected.append(_closing[token])
+        elif token in _closers:
+            if not expected or expected.pop() != token:
+                raise ValueError(f"Unbalanced {token!r} at {match.start()} in {text!r}")
+    if expected:
+        raise ValueError(f"Missing {expected[-1]!r} in {text!r}")
+    last = text[item_start:end]
+    if items or last:
+        items.append(last)
+    return items
+
+
+def _inside(text: str, left: str, right: str, sep: str = ',') -> list[str]:
+    if not (text.startswith(left) and text.endswith(right)) or len(text) < len(left) + len(right):
+        raise ValueError(f"Expected {left}...{right}, got {text!r}")
+    return split(text, sep, len(left), len(text) - len(right))
+
+
+def sequence(text: str) -> list[str]:
+    """Items of a tuple or sequence `<<a,b,...>>`."""
+    return _inside(text, '<<', '>>')
+
+
+def set_items(text: str) -> list[str]:
+    """Items of a set `{a,b,...}`."""
+    return _inside(text, '{', '}')
+
+
+def record(text: str) -> dict[str, str]:
+    """Fields of a record `[name|->value,...]`."""
+    fields = {}
+    for field in _inside(text, '[', ']'):
+        name, sep, value = field.partition('|->')
+        if not sep:
+            raise ValueError(f"Expected name|->value, got {field!r}")
+        fields[name] = value
+    return fields
+
+
+def function(text: str) -> list[tuple[str, str]]:
+    """`(key, value)` pairs of a function `(k1:>v1@@k2:>v2...)`; TLC prints an empty one as `<<>>`."""
+    if text == '<<>>':
+        return []
+    pairs = []
+    for item in _inside(text, '(', ')', '@@'):
+        pair = split(item, ':>')
+        if len(pair) != 2:
+            raise ValueError(f"Expected key:>value, got {item!r}")
+        pairs.append((pair[0], pair[1]))
+    return pairs
+
+
+class Interner:
+    """Small integer ids for distinct texts, in order of first use, so values compare and hash as ints."""
+
+    def __init__(self):
+        self.ids: dict[str, int] = {}
+        self.texts: list[str] = []
+
+    def __call__(self, text: str) -> int:
+        text_id = self.ids.get(text)
+        if text_id is None:
+            text_id = self.ids[text] = len(self.texts)
+            self.texts.append(text)
+        return text_id
@@ -1,15 +1,56 @@
-import codecs
-import copy
+import functools
 import re
-import pyparsing as pp
 from lib import *
-from extractor import ProtocolObject
-from toolz import partition
+from extractor import ProtocolObject, register
+from tlastate import MESSAGE_CACHE_SIZE, STATE_CACHE_SIZE, get_variable
+import tlavalue
 
+def _zxid(matched) -> int:
+    return (int(matched.group(1)) << 32) | int(matched.group(2))
 
-num_nodes = 3
+# Pattern and reader of `(mzxid, mepoch, mreq_id)`, by the `mtype` tag a
+# message starts with.
+_message_formats = {
+    # FOLLOWERINFO
+    'FI': (re.compile(r"mtype\|->FI,mzxid\|-><<(\d+),(\d+)>>"), lambda m: (_zxid(m), None, None)),
+    # LEADERINFO
+    'LI': (re.compile(r"mtype\|->LI,mzxid\|-><<(\d+),(\d+)>>"), lambda m: (_zxid(m), None, None)),
+    # ACKEPOCH
+    'AE': (re.compile(r"mtype\|->AE,mzxid\|-><<(\d+),(\d+)>>,mepoch\|->([-\d]+)"),
+           lambda m: (_zxid(m), int(m.group(2)), None)),
+    # NEWLEADER
+    'NL': (re.compile(r"mtype\|->NL,mzxid\|-><<(\d+),(\d+)>>"), lambda m: (_zxid(m), None, None)),
+    # ACKLD
+    'AL': (re.compile(r"mtype\|->AL,mzxid\|-><<(\d+),(\d+)>>"), lambda m: (_zxid(m), None, None)),
+    # UPTODATE
+    'UT': (re.compile(r"mtype\|->UT,mzxid\|-><<(\d+),(\d+)>>"), lambda m: (_zxid(m), None, None)),
+    # PROPOSAL
+    'PP': (re.compile(r"mtype\|->PP,mzxid\|-><<(\d+),(\d+)>>,mdata\|->(\d+)"),
+           lambda m: (_zxid(m), None, int(m.group(3)))),
+    # ACK
+    'AK': (re.compile(r"mtype\|->AK,mzxid\|-><<(\d+),(\d+)>>"), lambda m: (_zxid(m), None, None)),
+    # COMMIT
+    'CT': (re.compile(r"mtype\|->CT,mzxid\|-><<(\d+),(\d+)>>"), lambda m: (_zxid(m), None, None)),
+    # DIFF
+    'DF': (re.compile(r"mtype\|->DF,mzxid\|-><<(\d+),(\d+)>>"), lambda m: (_zxid(m), None, None)),
+    # TRUNC
+    'TC': (re.compile(r"mtype\|->TC,mtruncZxid\|-><<(\d+),(\d+)>>"), lambda m: (_zxid(m), None, None)),
+}
+_mtype_prefix = 'mtype|->'
+
+@functools.lru_cache(maxsize=MESSAGE_CACHE_SIZE)
+def _parse_message_fields(message: str) -> tuple[str, int, int, int]:
+    """`(mtype, mzxid, mepoch, mreq_id)` of a message record's inner text."""
+    if message.startswith(_mtype_prefix):
+        mtype = message[len(_mtype_prefix):message.find(',')]
+        message_format = _message_formats.get(mtype)
+        if message_format is not None and (matched := message_format[0].match(message)) is not None:
+            return (mtype,) + message_format[1](matched)
+    raise ValueError(f"Unknown message type: {message}")
 
 class ZKProposal(ProtocolObject):
+    __slots__ = ('mzxid', 'mreq_id')
+
     def __init__(self):
         self.mzxid: int = None
         self.mreq_id: int = None
@@ -19,6 +60,9 @@ class ZKProposal(ProtocolObject):
         raise NotImplementedError
 
 class ZkMessage(ProtocolObject):
+    __slots__ = ('mtype', 'msource', 'mdest', 'mzxid', 'mepoch', 'mreq_id', 'mnew_leader_zxid', 'mproposals',
+                 'mcommits', 'count')
+
     def __init__(self):
         self.mtype: str = None
         self.msource: int = None
@@ -69,94 +113,19 @@ class ZkMessage(ProtocolObject):
         res.msource = src
         res.mdest = dst
         res.count = count
-        if (matched := re.match(r"mtype\|->FI,mzxid\|-><<(\d+),(\d+)>>", message)):
-            # FOLLOWERINFO
-            res.mtype = "FI"
-            res.mzxid = (int(matched.group(1)) << 32) | int(matched.group(2))
-        elif (matched := re.match(r"mtype\|->LI,mzxid\|-><<(\d+),(\d+)>>", message)):
-            # LEADERINFO
-            res.mtype = "LI"
-            res.mzxid = (int(matched.group(1)) << 32) | int(matched.group(2))
-        elif (matched := re.match(r"mtype\|->AE,mzxid\|-><<(\d+),(\d+)>>,mepoch\|->([-\d]+)", message)):
-            # ACKEPOCH
-            res.mtype = "AE"
-            res.mzxid = (int(matched.group(1)) << 32) | int(matched.group(2))
-            res.mepoch = int(matched.group(2))
-        elif (matched := re.match(r"mtype\|->NL,mzxid\|-><<(\d+),(\d+)>>", message)):
-            # NEWLEADER
-            res.mtype = "NL"
-            res.mzxid = (int(matched.group(1)) << 32) | int(matched.group(2))
-        elif (matched := re.match(r"mtype\|->AL,mzxid\|-><<(\d+),(\d+)>>", message)):
-            # ACKLD
-            res.mtype = "AL"
-            res.mzxid = (int(matched.group(1)) << 32) | int(matched.group(2))
-        elif (matched := re.match(r"mtype\|->UT,mzxid\|-><<(\d+),(\d+)>>", message)):
-            # UPTODATE
-            res.mtype = "UT"
-            res.mzxid = (int(matched.group(1)) << 32) | int(matched.group(2))
-        elif (matched := re.match(r"mtype\|->PP,mzxid\|-><<(\d+),(\d+)>>,mdata\|->(\d+)", message)):
-            # PROPOSAL
-            res.mtype = "PP"
-            res.mzxid = (int(matched.group(1)) << 32) | int(matched.group(2))
-            res.mreq_id = int(matched.group(3))
-        elif (matched := re.match(r"mtype\|->AK,mzxid\|-><<(\d+),(\d+)>>", message)):
-            # ACK
-            res.mtype = "AK"
-            res.mzxid = (int(matched.group(1)) << 32) | int(matched.group(2))
-        elif (matched := re.match(r"mtype\|->CT,mzxid\|-><<(\d+),(\d+)>>", message)):
-            # COMMIT
-            res.mtype = "CT"
-            res.mzxid = (int(matched.group(1)) << 32) | int(matched.group(2))
-        elif (matched := re.match(r"mtype\|->DF,mzxid\|-><<(\d+),(\d+)>>", message)):
-            # DIFF
-            res.mtype = "DF"
-            res.mzxid = (int(matched.group(1)) << 32) | int(matched.group(2))
-        elif (matched := re.match(r"mtype\|->TC,mtruncZxid\|-><<(\d+),(\d+)>>", message)):
-            # TRUNC
-            res.mtype = "TC"
-            res.mzxid = (int(matched.group(1)) << 32) | int(matched.group(2))
-        else:
-            raise ValueError(f"Unknown message type: {message}")
-        return res
-    
-    def to_dict(self):
-        d = {k: v for k, v in self.__dict__.items() if v is not None}
-        return d
-
-pp_message = pp.Suppress("[") + pp.Word(pp.srange(r"[a-zA-Z0-9_|\->,<>{}]")) + pp.Suppress("]")
-pp_channel = pp.Suppress('<<') + pp.Group(pp.Empty() ^ pp.delimitedList(pp_message, ',')) + pp.Suppress('>>')
-pp_node_channels = pp.Suppress('<<') + pp.Group(pp.Empty() ^ pp.delimitedList(pp_channel, ',')) + pp.Suppress('>>')
-pp_all_nodes_channels = pp.Suppress('<<') + pp.Group(pp.Empty() ^ pp.delimitedList(pp_node_channels, ',')) + pp.Suppress('>>')
-
-def get_nested_parser(num_elements_per_layer, left='<<', right='>>'):
-    pattern = r'<<(.*)>>'
-    for num_elements in reversed(num_elements_per_layer):
-        pattern = "<<" + ','.join([pattern] * num_elements) + ">>"
-    total = 1
-    for num_elements in num_elements_per_layer:
-        total *= num_elements
-    def parser(s):
-        res = re.match(pattern, s).groups()
-        res = [[item.strip('[]') for item in re.findall(r'\[.*?\]', res_i)] for res_i in res]
-        for num_elements in reversed(num_elements_per_layer):
-            res = list(partition(num_elements, res))
+        res.mtype, res.mzxid, res.mepoch, res.mreq_id = _parse_message_fields(message)
         return res
 
-    return parser
-
-def pp_channel_parser(s):
-    return [[item.strip('[]') for item in re.findall(r'\[.*?\]', s)]]
-pp_node_channels_parser = get_nested_parser([num_nodes])
-pp_all_nodes_channels_parser = get_nested_parser([num_nodes, num_nodes])
+def get_records(sequence: str) -> list[str]:
+    """The records of a sequence, each as its text inside the brackets."""
+    return [record[1:-1] for record in tlavalue.sequence(sequence)]
 
 
-def get_messages_from_state(state) -> list[list[list[str]]]:
-    messages = [variable for variable in codecs.decode(state, 'unicode_escape').split('/\\') if variable.startswith(f' msgs')][0].replace('\n', '').replace(' ', '')
-    messages = messages.lstrip('msgs=')
-    messages = pp_all_nodes_channels_parser(messages)[0]
-    return messages
-
-def get_parsed_messages_diff(prev_node_messages, node_messages) -> list[ZkMessage]:
+def get_parsed_messages_diff(prev_node_messages, node_messages, messages: list[str]) -> list[ZkMessage]:
+    """
+    Messages sent and received between two states, from their channels as
+    given by `ZKExtractor.get_channels`; `messages` are the texts by id.
+    """
     diffs_recv = []
     diffs_send = []
     for i, (prev_node, node) in enumerate(zip(prev_node_messages, node_messages)):
@@ -169,7 +138,7 @@ def get_parsed_messages_diff(prev_node_messages, node_messages) -> list[ZkMessag
                         break
                 new_messages = channel[prefix:]
                 for message in new_messages:
-                    diffs_send.append(ZkMessage.parse(message, i+1, j+1, count=1))
+                    diffs_send.append(ZkMessage.parse(messages[message], i+1, j+1, count=1))
             elif len(prev_channel) > len(channel):
                 # remove suffix
                 suffix = len(prev_channel)-1
@@ -178,21 +147,18 @@ def get_parsed_messages_diff(prev_node_messages, node_messages) -> list[ZkMessag
                         break
                 used_messages = prev_channel[:suffix+1]
                 for message in used_messages:
-                    diffs_recv.append(ZkMessage.parse(message, i+1, j+1, count=-1))
+                    diffs_recv.append(ZkMessage.parse(messages[message], i+1, j+1, count=-1))
             else:
                 if prev_channel != channel:
                     print(f"Diff in node {i}, channel {j}")
-                    print(f"Prev: {prev_channel}")
-                    print(f"New: {channel}")
+                    print(f"Prev: {[messages[message] for message in prev_channel]}")
+                    print(f"New: {[messages[message] for message in channel]}")
                     raise RuntimeError("Unexpected message diff")
     return diffs_recv + diffs_send
 
 def get_hisotry_from_state(state) -> list[list[str]]:
-    history = [variable for variable in codecs.decode(state, 'unicode_escape').split('/\\') if variable.startswith(f' history')][0].replace('\n', '').replace(' ', '')
-    history = history.lstrip('history=')
-    # history = pp_node_channels.parse_string(history).as_list()[0]
-    history = pp_node_channels_parser(history)[0]
-    return history
+    history = get_variable(state, 'history')
+    return [get_records(node) for node in tlavalue.sequence(history)]
 
 def get_history_diff_req_id(prev_history, cur_history) -> tuple[int, int]:
     req_id = None
@@ -209,9 +175,8 @@ def get_history_diff_req_id(prev_history, cur_history) -> tuple[int, int]:
     return dest, req_id
 
 def get_last_committed(prev_state) -> list[int]:
-    last_committed = [variable for variable in codecs.decode(prev_state, 'unicode_escape').split('/\\') if variable.startswith(f' lastCommitted')][0].replace('\n', '').replace(' ', '').lstrip('lastCommitted=')
-    # last_committed = pp_channel.parse_string(last_committed).as_list()[0]
-    last_committed = pp_channel_parser(last_committed)[0]
+    last_committed = get_variable(prev_state, 'lastCommitted')
+    last_committed = get_records(last_committed)
     last_committed = [int(re.match(r'zxid\|-><<\d+,\d+>>,index\|->(\d+)', last_committed_i).group(1)) for last_committed_i in last_committed]
     return last_committed
 
@@ -229,14 +194,25 @@ def get_last_committed_diff(prev_state, cur_state) -> tuple[int, int]:
     return index, src
 
 def get_req_id(state, index, src):
-    history = [variable for variable in codecs.decode(state, 'unicode_escape').split('/\\') if variable.startswith(f' history')][0].replace('\n', '').replace(' ', '').lstrip('history=')
-    history = pp_node_channels_parser(history)[0][src-1]
+    history = get_hisotry_from_state(state)[src-1]
     req_id = int(re.match(r'zxid\|-><<\d+,\d+>>,value\|->(\d+),ackSid\|->\{.*\},epoch\|->\d+', history[index-1]).group(1))
     return req_id
 
+@register('zk')
 class ZKExtractor(Extractor):
     def __init__(self):
-        ...
+        # Message records of the states seen by this extractor by id; channels
+        # are kept as tuples of ids. Both go away with the extractor.
+        self.intern_message = tlavalue.Interner()
+        self.get_channels = functools.lru_cache(maxsize=STATE_CACHE_SIZE)(self._get_channels)
+
+    def _get_channels(self, messages: str) -> tuple[tuple[tuple[int, ...], ...], ...]:
+        """The message ids of each channel of a `msgs` value; msgs[i][j] is the channel from server i to server j."""
+        return tuple(tuple(tuple(map(self.intern_message, get_records(channel))) for channel in tlavalue.sequence(node))
+                     for node in tlavalue.sequence(messages))
+
+    def get_channels_from_state(self, state) -> tuple[tuple[tuple[int, ...], ...], ...]:
+        return self.get_channels(get_variable(state, 'msgs'))
     
     # @override
     def extract(self, action, prev_state, cur_state) -> dict:
@@ -254,9 +230,9 @@ class ZKExtractor(Extractor):
                 req_id = get_req_id(cur_state, committed, src)
                 return {"action": action, "diff": [ZkMessage.makeClientResponse(req_id, src=src, count=1)]}
         else:
-            prev_node_messages = get_messages_from_state(prev_state)
-            node_messages = get_messages_from_state(cur_state)
-            diffs = get_parsed_messages_diff(prev_node_messages, node_messages)
+            prev_node_messages = self.get_channels_from_state(prev_state)
+            node_messages = self.get_channels_from_state(cur_state)
+            diffs = get_parsed_messages_diff(prev_node_messages, node_messages, self.intern_message.texts)
             if action == 'ConnectAndFollowerSendFOLLOWERINFO':
                 # TODO: prepend TCP message for this action
                 assert len(diffs) == 1 and diffs[0].count == 1 and diffs[0].mtype == "FI"